@@ -0,0 +1,97 @@
+"""
+Long-lived pool of ready-to-run NaturalLanguageToMQL agents.
+
+Building a NaturalLanguageToMQL (LLM client, masker, toolkit, compiled
+ReAct graph, collection info) takes seconds; app.py used to pay that for
+every question. AgentService builds `workers` instances once at startup,
+all sharing one ChatOpenAI client, the process-wide MongoClient, a single
+warmed copy of the collection info, one schema digest and one checked set
+of query templates. A question checks out an idle worker, runs with only
+per-request state (messages and token mapping, cleared by `reset()`), and
+returns it to the pool.
+
+Each worker keeps its own masker and toolkit, so up to `workers`
+questions run concurrently from different threads; further callers wait
+for a free worker.
+
+    service = AgentService(workers=4)
+    print(service.answer("how much balance leave is there for emp id 4598?"))
+"""
+
+import queue
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_openai import ChatOpenAI
+
+from Mongo import LLM_TIMEOUT_S, MONGODB_URI, AgentBudget, NaturalLanguageToMQL
+from MongoClientManager import get_client
+from Tracing import span
+
+AGENT_MODEL = "gpt-4o"
+
+
+class AgentService:
+    def __init__(self, workers: int = 4, llm=None, warm: bool = True):
+        self.llm = llm or ChatOpenAI(model=AGENT_MODEL, timeout=LLM_TIMEOUT_S, max_retries=1)
+        self.client = get_client(MONGODB_URI)
+
+        start = time.perf_counter()
+        first = NaturalLanguageToMQL(llm=self.llm, client=self.client)
+        collection_info = first.db_wrapper.collection_info_cache
+        self._workers: List[NaturalLanguageToMQL] = [first] + [
+            NaturalLanguageToMQL(
+                llm=self.llm,
+                client=self.client,
+                collection_info=collection_info,
+                schema_digest=first.schema_digest,
+                templates=first.templates,
+            )
+            for _ in range(workers - 1)
+        ]
+        self._idle: "queue.Queue[NaturalLanguageToMQL]" = queue.Queue()
+        for worker in self._workers:
+            self._idle.put(worker)
+        print(f"AgentService ready: {workers} workers in {time.perf_counter() - start:.2f}s")
+
+        if warm:
+            self.warm_up()
+
+    def warm_up(self, llm: bool = False) -> None:
+        """Open the Mongo connections, fill the collection info and, if `llm`,
+        make one tiny model call so the first question skips connection setup."""
+        self.client.admin.command("ping")
+        self._workers[0].db_wrapper.get_collection_info()
+        if llm:
+            self.llm.invoke("ping")
+
+    @contextmanager
+    def worker(self, timeout: Optional[float] = None) -> Iterator[NaturalLanguageToMQL]:
+        """Check out an idle worker, reset to a clean per-request state."""
+        with span("agent_service.checkout", idle=self._idle.qsize()):
+            try:
+                converter = self._idle.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError(f"No agent worker became free within {timeout}s")
+        converter.reset()
+        try:
+            yield converter
+        finally:
+            converter.reset()
+            self._idle.put(converter)
+
+    def answer(
+        self, question: str, timeout: Optional[float] = None, budget: Optional[AgentBudget] = None
+    ) -> str:
+        with self.worker(timeout) as converter:
+            converter.convert_to_mql_and_execute_query(question, budget)
+            return converter.final_answer()
+
+    def stream(
+        self, question: str, timeout: Optional[float] = None, budget: Optional[AgentBudget] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """NaturalLanguageToMQL.stream_events on a pooled worker, which stays
+        checked out until the generator is exhausted or closed."""
+        with self.worker(timeout) as converter:
+            yield from converter.stream_events(question, budget=budget)
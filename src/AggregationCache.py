@@ -0,0 +1,157 @@
+"""
+In-process cache of raw aggregation results.
+
+Users keep asking the same questions (leave balance, headcount by
+department, pending offboarding, ...), and the agent keeps generating the
+same `db.<collection>.aggregate([...])` command for them. The cache keys a
+result by scope, collection and a hash of the canonicalized pipeline, so
+the same pipeline written with a different key order hits the same entry.
+The scope is chosen by the caller; MongoDBDatabasePIIToolkit uses the
+database name and whether it reads raw or shadow collections, so a cache
+shared by several toolkits never serves raw documents to a shadow-mode
+toolkit (whose masker passes values through).
+
+Entries hold the raw, unmasked documents: masking runs on every read, so
+tokens always come from the current masker and mapping. The cached lists
+are shared between reads and must be treated as read-only; the maskers
+build new structures and never modify their input.
+
+- size-bounded LRU (`max_entries`), entries larger than `max_entry_docs`
+  are not stored;
+- TTL per collection (`ttls`), `default_ttl` otherwise; an entry that also
+  reads other collections through $lookup/$unionWith/$graphLookup expires
+  with the shortest of their TTLs;
+- `invalidate(collection)` drops every entry that reads `collection`, in
+  every scope. Only reloads done in this process can call it (the rollup
+  refresh and the shadow builder accept a cache for that); the ingest
+  scripts run as separate processes, so for them the TTL bounds staleness;
+- `stats()` reports hits, misses, hit rate, evictions and expirations.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from bson.json_util import dumps
+
+# Keys whose value is an ordered spec; their key order is kept when hashing
+ORDERED_KEYS = {"$sort", "sortBy"}
+
+
+def canonicalize(value: Any, ordered: bool = False) -> Any:
+    """Sort document keys recursively, except inside order-sensitive specs."""
+    if isinstance(value, dict):
+        items = value.items() if ordered else sorted(value.items())
+        return {k: canonicalize(v, k in ORDERED_KEYS) for k, v in items}
+    if isinstance(value, (list, tuple)):
+        return [canonicalize(v) for v in value]
+    return value
+
+
+def pipeline_hash(agg_pipeline: List[Dict[str, Any]]) -> str:
+    canonical = dumps(canonicalize(agg_pipeline), separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def referenced_collections(stages: Any, found: Optional[Set[str]] = None) -> Set[str]:
+    """Collections a pipeline reads besides its own, through joins and unions."""
+    found = set() if found is None else found
+    if isinstance(stages, list):
+        for stage in stages:
+            referenced_collections(stage, found)
+    elif isinstance(stages, dict):
+        for key, value in stages.items():
+            if key in ("$lookup", "$graphLookup") and isinstance(value, dict):
+                if isinstance(value.get("from"), str):
+                    found.add(value["from"])
+            elif key == "$unionWith":
+                if isinstance(value, str):
+                    found.add(value)
+                elif isinstance(value, dict) and isinstance(value.get("coll"), str):
+                    found.add(value["coll"])
+            referenced_collections(value, found)
+    return found
+
+
+class AggregationCache:
+    """Thread-safe LRU of raw aggregation results with per-collection TTLs."""
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        default_ttl: float = 300.0,
+        ttls: Optional[Dict[str, float]] = None,
+        max_entry_docs: int = 5000,
+    ):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        self.max_entry_docs = max_entry_docs
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, Set[str], List[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def ttl_for(self, collection: str) -> float:
+        return self.ttls.get(collection, self.default_ttl)
+
+    def get(
+        self, collection: str, agg_pipeline: List[Dict[str, Any]], scope: str = ""
+    ) -> Optional[List[Dict[str, Any]]]:
+        key = (scope, collection, pipeline_hash(agg_pipeline))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(
+        self, collection: str, agg_pipeline: List[Dict[str, Any]], docs: List[Dict[str, Any]], scope: str = ""
+    ) -> bool:
+        """Store `docs` under `scope`; returns False when the result is too large to cache."""
+        if len(docs) > self.max_entry_docs:
+            return False
+        collections = referenced_collections(agg_pipeline) | {collection}
+        expires_at = time.monotonic() + min(self.ttl_for(name) for name in collections)
+        key = (scope, collection, pipeline_hash(agg_pipeline))
+        with self._lock:
+            self._entries[key] = (expires_at, collections, docs)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def invalidate(self, collection: Optional[str] = None) -> int:
+        """Drop the entries that read `collection` (all entries when None)."""
+        with self._lock:
+            if collection is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+                return dropped
+            stale = [key for key, (_, collections, _) in self._entries.items() if collection in collections]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,297 @@
+"""
+asyncio variant of MongoDBDatabasePIIToolkit.
+
+The agent's tools (`mongodb_query`, `mongodb_schema`,
+`mongodb_list_collections`, `mongodb_query_checker`) get `_arun`
+implementations that run on pymongo's AsyncMongoClient, so one process can
+serve many concurrent questions from a single event loop:
+
+    toolkit = AsyncMongoDBDatabasePIIToolkit.from_connection_string(uri, database="hr", pii_masker=FieldBasedPIIMasker())
+    tools = AsyncMongoDBDatabaseToolkit(db=toolkit, llm=llm).get_tools()
+    agent = create_react_agent(model=llm, tools=tools, prompt=system_message)
+
+    async def answer(question):
+        masker = FieldBasedPIIMasker()
+        with toolkit.use_masker(masker):
+            result = await agent.ainvoke({"messages": [("user", question)]})
+        return masker.unmask(result["messages"][-1].content)
+
+Each question masks with its own masker (set per asyncio task through
+`use_masker`), so concurrent questions never share a token mapping.
+Parsing, limits, shadow rewrites, result cache and formatting are
+inherited from the synchronous toolkit; the synchronous client is only
+used for the one-off setup the base class does in `__init__`.
+
+Masking and serialization of results with at least `offload_min_docs`
+documents run in a thread pool so they do not stall the event loop.
+"""
+
+import asyncio
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from functools import partial
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForToolRun
+from langchain_mongodb.agent_toolkit import MongoDBDatabaseToolkit
+from langchain_mongodb.agent_toolkit.tool import (
+    InfoMongoDBDatabaseTool,
+    ListMongoDBDatabaseTool,
+    QueryMongoDBCheckerTool,
+    QueryMongoDBDatabaseTool,
+)
+from pymongo import AsyncMongoClient, MongoClient
+from pymongo.errors import ExecutionTimeout, PyMongoError
+
+from MogoDBDatabaseToolkitPii import MongoDBDatabasePIIToolkit
+from HRRollups import rollup_description
+from MongoClientManager import get_async_client, get_client
+from QueryCostGuard import PipelineRejected
+from ResultFormatter import count_tokens, format_results
+from Tracing import span
+
+# Masker of the question being answered by the current asyncio task
+_current_masker: ContextVar[Optional[Any]] = ContextVar("current_masker", default=None)
+
+
+class AsyncMongoDBDatabasePIIToolkit(MongoDBDatabasePIIToolkit):
+    """MongoDBDatabasePIIToolkit with async `arun`, collection listing and info."""
+
+    def __init__(
+        self,
+        client: MongoClient,
+        async_client: AsyncMongoClient,
+        database: str,
+        *args,
+        executor: Optional[Executor] = None,
+        offload_min_docs: int = 200,
+        **kwargs,
+    ):
+        super().__init__(client, database, *args, **kwargs)
+        self._async_client = async_client
+        self._adb = async_client.get_database(database, read_preference=self._db.read_preference)
+        # None uses the event loop's default ThreadPoolExecutor
+        self.executor = executor
+        self.offload_min_docs = offload_min_docs
+
+    @classmethod
+    def from_connection_string(cls, connection_string: str, database: Optional[str] = None, **kwargs: Any):
+        client = get_client(connection_string)
+        async_client = get_async_client(connection_string)
+        database = database or client.get_default_database().name
+        return cls(client, async_client, database, **kwargs)
+
+    # -----------------------
+    # Per-question masker
+    # -----------------------
+
+    @property
+    def masker(self):
+        return _current_masker.get() or self.piiMasker
+
+    @contextmanager
+    def use_masker(self, masker):
+        """Mask everything run by the current task (and its children) with `masker`."""
+        token = _current_masker.set(masker)
+        try:
+            yield masker
+        finally:
+            _current_masker.reset(token)
+
+    # -----------------------
+    # Async counterparts of the tool entry points
+    # -----------------------
+
+    async def aget_usable_collection_names(self) -> List[str]:
+        names = await self._adb.list_collection_names(authorizedCollections=True)
+        self._all_colls = set(names)
+        return self.get_usable_collection_names()
+
+    async def aget_collection_info(self, collection_names: Optional[List[str]] = None) -> str:
+        all_coll_names = self.get_usable_collection_names()
+        if collection_names is not None:
+            missing_collections = set(collection_names).difference(all_coll_names)
+            if missing_collections:
+                raise ValueError(
+                    f"collection_names {missing_collections} not found in database"
+                )
+            all_coll_names = collection_names
+
+        missing = [coll for coll in all_coll_names if coll not in self._collection_info]
+        built = await asyncio.gather(*(self._abuild_collection_info(coll) for coll in missing))
+        self._collection_info.update(zip(missing, built))
+        return "\n\n".join(sorted(self._collection_info[coll] for coll in all_coll_names))
+
+    async def _abuild_collection_info(self, collection: str) -> str:
+        """Same text as MongoDBDatabase.get_collection_info for one collection."""
+        doc = await self._adb[collection].find_one({}) or dict()
+        schema = "\n".join(self._parse_doc(doc, ""))
+        coll_info = f"Database name: {self._adb.name}\n"
+        coll_info += f"Collection name: {collection}\n"
+        description = rollup_description(collection)
+        if description:
+            coll_info += f"Description: {description}\n"
+        coll_info += f"Schema from a sample of documents from the collection:\n{schema.rstrip()}"
+        has_extra_info = self._indexes_in_coll_info or self._sample_docs_in_coll_info
+        if has_extra_info:
+            coll_info += "\n\n/*"
+        if self._indexes_in_coll_info:
+            coll_info += f"\n{await self._aget_collection_indexes(collection)}\n"
+        if self._sample_docs_in_coll_info:
+            coll_info += f"\n{await self._aget_sample_docs(collection)}\n"
+        if has_extra_info:
+            coll_info += "*/"
+        return coll_info
+
+    async def _aget_collection_indexes(self, collection: str) -> str:
+        cursor = await self._adb[collection].list_indexes()
+        indexes = await cursor.to_list()
+        if not indexes:
+            return ""
+        return f"Collection Indexes:\n{format_results(indexes, 'json')}"
+
+    async def _aget_sample_docs(self, collection: str) -> str:
+        col = self._async_physical_collection(collection)
+        docs = await col.find({}, limit=self._sample_docs_in_coll_info).to_list()
+        for doc in docs:
+            self._elide_doc(doc)
+        docs, _ = self.masker.mask(docs, collection=collection)
+        return (
+            f"{self._sample_docs_in_coll_info} documents from {collection} collection:\n"
+            f"{format_results(docs, self.output_format)}"
+        )
+
+    async def arun(self, command: str) -> str:
+        if not command.startswith("db."):
+            raise ValueError(f"Cannot run command {command}")
+
+        try:
+            col_name = command.split(".")[1]
+        except IndexError as e:
+            raise ValueError(
+                "Invalid command format. Could not extract collection name."
+            ) from e
+
+        if col_name not in self.get_usable_collection_names():
+            raise ValueError(f"Collection {col_name} does not exist!")
+
+        if ".aggregate(" not in command:
+            raise ValueError("Only aggregate(...) queries are currently supported.")
+
+        agg_pipeline = self._parse_command(command)
+        if self.use_shadow_collections:
+            agg_pipeline = self._shadow_pipeline(agg_pipeline)
+
+        try:
+            with span("mongo.aggregate", collection=col_name, stages=len(agg_pipeline)) as s:
+                result_list = self._cached_results(col_name, agg_pipeline)
+                s.set(cached=result_list is not None)
+                if result_list is None:
+                    result_list = await self._aaggregate(col_name, agg_pipeline)
+                    if self.result_cache is not None:
+                        self.result_cache.put(
+                            col_name, self._limit_pipeline(agg_pipeline), result_list, self._result_cache_scope
+                        )
+                s.set(docs_returned=len(result_list))
+        except PipelineRejected:
+            raise
+        except ExecutionTimeout as e:
+            raise ValueError(
+                f"Aggregation exceeded the {self.max_time_ms} ms time limit; "
+                "add a selective $match or reduce the work in the pipeline."
+            ) from e
+        except Exception as e:
+            raise ValueError(f"Error executing aggregation: {e}") from e
+
+        masker = self.masker
+        job = partial(self._mask_and_format, masker, col_name, result_list, agg_pipeline)
+        if len(result_list) >= self.offload_min_docs:
+            # copy_context keeps the pii.mask span under the current request span
+            output, truncated = await asyncio.get_running_loop().run_in_executor(self.executor, copy_context().run, job)
+        else:
+            output, truncated = job()
+        print(f"Result tokens ({self.output_format}): {count_tokens(output)}")
+        return output + self._truncation_notice(truncated)
+
+    async def arun_no_throw(self, command: str) -> str:
+        try:
+            return await self.arun(command)
+        except PyMongoError as e:
+            return f"Error: {e}"
+
+    async def _aaggregate(self, col_name: str, agg_pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        agg_pipeline = self._limit_pipeline(agg_pipeline)
+        coll = self._async_physical_collection(col_name)
+        print("Aggregation Pipeline:" , agg_pipeline)
+        if self.cost_guard is not None:
+            report = await self.cost_guard.acheck(coll, agg_pipeline)
+            print("Query cost:", report)
+        cursor = await coll.aggregate(agg_pipeline, **self._aggregate_options(agg_pipeline))
+        try:
+            return await cursor.to_list()
+        finally:
+            await cursor.close()
+
+    def _async_physical_collection(self, collection: str):
+        return self._adb[self._physical_collection(collection).name]
+
+
+# -----------------------
+# Tools with async implementations, same names and descriptions
+# -----------------------
+
+class AsyncQueryMongoDBDatabaseTool(QueryMongoDBDatabaseTool):
+    async def _arun(self, query: str, **kwargs: Any) -> str:
+        return await self.db.arun_no_throw(query)
+
+
+class AsyncInfoMongoDBDatabaseTool(InfoMongoDBDatabaseTool):
+    async def _arun(
+        self,
+        collection_names: str,
+        run_manager: Optional[AsyncCallbackManagerForToolRun] = None,
+    ) -> str:
+        return await self.db.aget_collection_info(
+            [t.strip() for t in collection_names.split(",")]
+        )
+
+
+class AsyncListMongoDBDatabaseTool(ListMongoDBDatabaseTool):
+    async def _arun(
+        self,
+        tool_input: str = "",
+        run_manager: Optional[AsyncCallbackManagerForToolRun] = None,
+    ) -> str:
+        return ", ".join(await self.db.aget_usable_collection_names())
+
+
+class AsyncQueryMongoDBCheckerTool(QueryMongoDBCheckerTool):
+    async def _arun(
+        self,
+        query: str,
+        run_manager: Optional[AsyncCallbackManagerForToolRun] = None,
+    ) -> str:
+        chain = self.prompt | self.llm
+        return await chain.ainvoke(query)
+
+
+ASYNC_TOOLS = {
+    QueryMongoDBDatabaseTool: AsyncQueryMongoDBDatabaseTool,
+    InfoMongoDBDatabaseTool: AsyncInfoMongoDBDatabaseTool,
+    ListMongoDBDatabaseTool: AsyncListMongoDBDatabaseTool,
+    QueryMongoDBCheckerTool: AsyncQueryMongoDBCheckerTool,
+}
+
+
+class AsyncMongoDBDatabaseToolkit(MongoDBDatabaseToolkit):
+    """MongoDBDatabaseToolkit whose tools also implement `_arun`."""
+
+    def get_tools(self):
+        tools = []
+        for tool in super().get_tools():
+            kwargs = {"db": self.db, "description": tool.description}
+            if isinstance(tool, QueryMongoDBCheckerTool):
+                kwargs["llm"] = self.llm
+            tools.append(ASYNC_TOOLS[type(tool)](**kwargs))
+        return tools
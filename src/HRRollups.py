@@ -0,0 +1,191 @@
+"""
+Materialized HR rollups, refreshed at ingest time.
+
+Questions such as "how many people joined in 2024", "leavers per region",
+"headcount by department" or "pending offboarding for IT" are fixed
+aggregations. Instead of letting the agent scan the raw report collections
+for them, each rollup below is computed with `$merge` into a small
+`rollup_*` collection (a few hundred rows), which the agent sees in the
+collection list and in the system prompt.
+
+Rollups contain only counts per year / department / region, no PII.
+
+Usage:
+    python src/HRRollups.py                          # refresh all rollups
+    python src/HRRollups.py --sources base_report    # only those built from base_report
+"""
+
+import argparse
+import os
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo.database import Database
+
+from ReportFields import (
+    ACTIVE,
+    ASSIGNMENT_STATUS,
+    BASE_REPORT,
+    DATE_OF_JOINING,
+    DATE_OF_RESIGNATION,
+    DEPARTMENT,
+    OFFBOARDING,
+    OFFBOARDING_DEPARTMENT,
+    OFFBOARDING_DONE,
+    OFFBOARDING_REGION,
+    OFFBOARDING_STATUS,
+    REGION,
+    as_date,
+    missing_fields,
+)
+
+ROLLUP_PREFIX = "rollup_"
+# Temporary field holding the parsed date, then its year, in the count-by-year pipelines
+ROLLUP_DATE = "_date"
+
+
+@dataclass(frozen=True)
+class Rollup:
+    name: str
+    source: str
+    description: str
+    pipeline: List[Dict[str, Any]]
+    # Source fields the pipeline reads, checked before every refresh
+    fields: Tuple[str, ...]
+
+
+def _count_by(keys: Dict[str, str], count_field: str) -> List[Dict[str, Any]]:
+    """$group/$project counting documents per `keys` (output name -> source field)."""
+    return [
+        {"$group": {"_id": {name: f"${field}" for name, field in keys.items()}, count_field: {"$sum": 1}}},
+        {"$project": {**{name: f"$_id.{name}" for name in keys}, count_field: 1}},
+    ]
+
+
+def _count_by_year(date_field: str, count_field: str) -> List[Dict[str, Any]]:
+    keys = {"year": ROLLUP_DATE, DEPARTMENT: DEPARTMENT, REGION: REGION}
+    pipeline = [
+        {"$set": {ROLLUP_DATE: as_date(date_field)}},
+        {"$match": {ROLLUP_DATE: {"$type": "date"}}},
+        {"$set": {ROLLUP_DATE: {"$year": f"${ROLLUP_DATE}"}}},
+    ]
+    return pipeline + _count_by(keys, count_field)
+
+
+ROLLUPS = [
+    Rollup(
+        name="rollup_joiners_by_year",
+        source=BASE_REPORT,
+        description="Employees who joined, per year of joining, department and region (field: joiners).",
+        pipeline=_count_by_year(DATE_OF_JOINING, "joiners"),
+        fields=(DATE_OF_JOINING, DEPARTMENT, REGION),
+    ),
+    Rollup(
+        name="rollup_leavers_by_year",
+        source=BASE_REPORT,
+        description="Employees who resigned, per year of resignation, department and region (field: leavers).",
+        pipeline=_count_by_year(DATE_OF_RESIGNATION, "leavers"),
+        fields=(DATE_OF_RESIGNATION, DEPARTMENT, REGION),
+    ),
+    Rollup(
+        name="rollup_headcount_by_department",
+        source=BASE_REPORT,
+        description="Current employees (assignment status ACTIVE), per department and region (field: headcount).",
+        pipeline=[{"$match": {ASSIGNMENT_STATUS: ACTIVE}}]
+        + _count_by({DEPARTMENT: DEPARTMENT, REGION: REGION}, "headcount"),
+        fields=(ASSIGNMENT_STATUS, DEPARTMENT, REGION),
+    ),
+    Rollup(
+        name="rollup_pending_offboarding",
+        source=OFFBOARDING,
+        description="Offboarding cases not yet completed, per department and region (field: pending).",
+        pipeline=[{"$match": {OFFBOARDING_STATUS: {"$nin": OFFBOARDING_DONE}}}]
+        + _count_by({DEPARTMENT: OFFBOARDING_DEPARTMENT, REGION: OFFBOARDING_REGION}, "pending"),
+        fields=(OFFBOARDING_STATUS, OFFBOARDING_DEPARTMENT, OFFBOARDING_REGION),
+    ),
+]
+ROLLUPS_BY_NAME = {rollup.name: rollup for rollup in ROLLUPS}
+
+
+def is_rollup_collection(collection: str) -> bool:
+    return collection.startswith(ROLLUP_PREFIX)
+
+
+def rollup_description(collection: str) -> Optional[str]:
+    rollup = ROLLUPS_BY_NAME.get(collection)
+    if rollup is None:
+        return None
+    return f"Precomputed rollup of {rollup.source}: {rollup.description}"
+
+
+def rollup_prompt() -> str:
+    """System prompt section pointing the agent at the rollups."""
+    lines = [
+        "",
+        "Precomputed rollups (prefer these over scanning the report collections for counts):",
+    ]
+    lines += [f"- {rollup.name}: {rollup.description}" for rollup in ROLLUPS]
+    return "\n".join(lines) + "\n"
+
+
+def refresh_rollup(db: Database, rollup: Rollup) -> int:
+    """Recompute one rollup in place; returns its row count.
+
+    Rows are upserted with $merge and stamped with the refresh time; rows
+    not produced by this refresh (e.g. a department that no longer exists)
+    are deleted afterwards, so readers never see an empty collection.
+
+    Raises ValueError, leaving the rollup untouched, when a source field is
+    missing from a sample document: counts over a missing field would be
+    empty or wrong, and the agent is told to prefer them.
+    """
+    missing = missing_fields(db[rollup.source], rollup.fields)
+    if missing:
+        raise ValueError(
+            f"{rollup.name}: {rollup.source} has no field(s) {missing}; "
+            "check the column names in ReportFields against the loaded report"
+        )
+    refreshed_at = datetime.now(timezone.utc).replace(microsecond=0)
+    pipeline = rollup.pipeline + [
+        {"$set": {"refreshed_at": refreshed_at}},
+        {"$merge": {"into": rollup.name, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+    db[rollup.source].aggregate(pipeline, allowDiskUse=True)
+    target = db[rollup.name]
+    target.delete_many({"refreshed_at": {"$ne": refreshed_at}})
+    return target.count_documents({})
+
+
+def refresh_rollups(db: Database, sources: Optional[Iterable[str]] = None, result_cache=None) -> Dict[str, int]:
+    """Refresh the rollups built from `sources` (all rollups when None)."""
+    sources = set(sources) if sources is not None else None
+    counts = {}
+    for rollup in ROLLUPS:
+        if sources is not None and rollup.source not in sources:
+            continue
+        counts[rollup.name] = refresh_rollup(db, rollup)
+        if result_cache is not None:
+            result_cache.invalidate(rollup.name)
+        print(f"[S] {rollup.source} -> {rollup.name}  (rows: {counts[rollup.name]})")
+    return counts
+
+
+def main():
+    from dotenv import load_dotenv
+    from MongoClientManager import get_client
+
+    parser = argparse.ArgumentParser(description="Refresh the HR rollup collections.")
+    parser.add_argument("--sources", nargs="+", default=None,
+                        help="only refresh rollups built from these collections")
+    parser.add_argument("--database", default="hr")
+    args = parser.parse_args()
+
+    load_dotenv(os.path.join(os.getcwd(), ".env"))
+    client = get_client(os.getenv("MONGODB_URI"))
+    counts = refresh_rollups(client[args.database], args.sources)
+    print(f"\nAll done. {len(counts)} rollups refreshed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,39 @@
 import re
 import copy
-from typing import Tuple, Dict, Any
-import spacy
+from collections import OrderedDict
+from typing import Tuple, Dict, Any, List, Optional
+from ModelRegistry import get_spacy_model
+
+# Pipeline components the entity recognizer needs; everything else (tagger,
+# parser, lemmatizer, ...) is switched off while batching through nlp.pipe.
+NER_COMPONENTS = ("ner", "entity_ruler")
 
 class JSONPIIMasker:
-    def __init__(self):
-        # Load SpaCy large English model
-        self.nlp = spacy.load("en_core_web_lg")
+    def __init__(
+        self,
+        use_pipe: bool = True,
+        batch_size: int = 64,
+        n_process: int = 1,
+        cache_size: int = 10000,
+        model: Optional[str] = None,
+    ):
+        # Shared spaCy pipeline ("lg" by default, see ModelRegistry)
+        self.nlp = get_spacy_model(model)
+
+        # Collect-then-batch mode: gather every string leaf first and run them
+        # through nlp.pipe instead of calling self.nlp once per string.
+        self.use_pipe = use_pipe
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.disabled_components = self._non_ner_components()
+
+        # Bounded LRU cache: string value -> detected (start, end, label) spans.
+        # Shared by mask() and mask_text() so repeated values such as
+        # departments or locations only hit the model once.
+        self.cache_size = cache_size
+        self.entity_cache: "OrderedDict[str, Tuple[Tuple[int, int, str], ...]]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
         
         # Regex patterns for things spaCy might miss or can't detect easily
         self.patterns = {
@@ -16,6 +43,11 @@ class JSONPIIMasker:
             "CREDIT_CARD": re.compile(r"\b(?:\d[ -]*?){13,16}\b"),
             "ZIP": re.compile(r"\b\d{5}(?:-\d{4})?\b"),
         }
+        # All patterns as named alternatives, in priority order, so one pass
+        # over the text finds every non-overlapping match
+        self.combined_pattern = re.compile(
+            "|".join(f"(?P<{label}>{pattern.pattern})" for label, pattern in self.patterns.items())
+        )
         
         # Entity labels from spaCy to mask
         self.spacy_labels = {
@@ -30,15 +62,20 @@ class JSONPIIMasker:
         self.mapping = {}
         self.counter = {}
 
-    def mask(self, data: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, str]]:
-        print("Masking data...")
-        print("Original Data:", data)
+    def mask(
+        self, data: Dict[str, Any], reset: bool = True, collection: Optional[str] = None
+    ) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        if reset:
+            self.reset()
+        if self.use_pipe:
+            masked_data = self._mask_batched(copy.deepcopy(data))
+        else:
+            masked_data = self._mask_recursive(copy.deepcopy(data))
+        return masked_data, self.mapping
+
+    def reset(self) -> None:
         self.mapping = {}
         self.counter = {}
-        masked_data = self._mask_recursive(copy.deepcopy(data))
-        print("Masked Data:", masked_data)
-        print(masked_data)
-        return masked_data, self.mapping
 
     def unmask(self, data: Dict[str, Any]) -> Dict[str, Any]:
         return self._unmask_recursive(copy.deepcopy(data))
@@ -49,14 +86,62 @@ class JSONPIIMasker:
         elif isinstance(obj, list):
             return [self._mask_recursive(item) for item in obj]
         elif isinstance(obj, str):
-            # First mask spaCy entities
-            masked_text = self._mask_spacy_entities(obj)
-            # Then mask regex patterns
-            masked_text = self._mask_regex_patterns(masked_text)
-            return masked_text
+            return self._mask_string(obj)
         else:
             return obj
 
+    def _mask_batched(self, obj):
+        """Mask every string leaf of `obj` in place using a single nlp.pipe run."""
+        if isinstance(obj, str):
+            return self._mask_recursive(obj)
+
+        leaves: List[Tuple[Any, Any, str]] = []
+        self._collect_string_leaves(obj, leaves)
+        spans = self.detect_entities_batch([text for _, _, text in leaves])
+        for (parent, key, text), text_spans in zip(leaves, spans):
+            parent[key] = self._apply_entities(text, text_spans)
+        return obj
+
+    def detect_entities_batch(self, texts: List[str]) -> List[Tuple[Tuple[int, int, str], ...]]:
+        """Detect spans for many strings at once.
+
+        Only distinct values that are not cached yet go through the model,
+        in a single nlp.pipe run.
+        """
+        pending = [text for text in dict.fromkeys(texts) if text not in self.entity_cache]
+        docs = self.nlp.pipe(
+            pending,
+            batch_size=self.batch_size,
+            n_process=self.n_process,
+            disable=self.disabled_components,
+        )
+        spacy_spans = {text: self._spacy_spans(doc) for text, doc in zip(pending, docs)}
+        return [self._detect_entities(text, spacy_spans.get(text)) for text in texts]
+
+    def _collect_string_leaves(self, obj, leaves: List[Tuple[Any, Any, str]]) -> None:
+        """Record (container, key, text) for every string, in traversal order."""
+        if isinstance(obj, dict):
+            items = obj.items()
+        elif isinstance(obj, list):
+            items = enumerate(obj)
+        else:
+            return
+        for key, value in items:
+            if isinstance(value, str):
+                leaves.append((obj, key, value))
+            else:
+                self._collect_string_leaves(value, leaves)
+
+    def _non_ner_components(self) -> List[str]:
+        keep = set(NER_COMPONENTS)
+        # Keep the shared tok2vec only if the recognizer listens to it
+        # (the sm/md/lg models ship NER with its own embedding layer).
+        if "tok2vec" in self.nlp.pipe_names:
+            listeners = getattr(self.nlp.get_pipe("tok2vec"), "listening_components", [])
+            if keep.intersection(listeners):
+                keep.add("tok2vec")
+        return [name for name in self.nlp.pipe_names if name not in keep]
+
     def _unmask_recursive(self, obj):
         if isinstance(obj, dict):
             return {k: self._unmask_recursive(v) for k, v in obj.items()}
@@ -69,36 +154,80 @@ class JSONPIIMasker:
         else:
             return obj
 
-    def _mask_spacy_entities(self, text: str) -> str:
-        doc = self.nlp(text)
-        spans = []
+    def _mask_string(self, text: str, spacy_spans=None) -> str:
+        return self._apply_entities(text, self._detect_entities(text, spacy_spans))
+
+    def _detect_entities(self, text: str, spacy_spans=None) -> Tuple[Tuple[int, int, str], ...]:
+        """Return sorted (start, end, label) spans to mask, served from the LRU cache when possible."""
+        cached = self.entity_cache.get(text)
+        if cached is not None:
+            self.entity_cache.move_to_end(text)
+            self.cache_hits += 1
+            return cached
+
+        self.cache_misses += 1
+        if spacy_spans is None:
+            spacy_spans = self._spacy_spans(self.nlp(text))
+        spans = tuple(sorted(spacy_spans + self._regex_spans(text, spacy_spans)))
+
+        if self.cache_size:
+            self.entity_cache[text] = spans
+            if len(self.entity_cache) > self.cache_size:
+                self.entity_cache.popitem(last=False)
+        return spans
 
-        # Collect spans of entities to mask
+    def _spacy_spans(self, doc) -> List[Tuple[int, int, str]]:
+        spans = []
         for ent in doc.ents:
             label = self.spacy_labels.get(ent.label_)
             if label:
-                spans.append((ent.start_char, ent.end_char, label, ent.text))
+                spans.append((ent.start_char, ent.end_char, label))
+        return spans
+
+    def _regex_spans(self, text: str, claimed: List[Tuple[int, int, str]]) -> List[Tuple[int, int, str]]:
+        """Find regex matches in the parts of `text` not already claimed by spaCy.
+
+        A single scan with the combined pattern per gap: the leftmost match
+        wins and, at the same position, the earlier pattern in `self.patterns`.
+        """
+        found = []
+        for gap_start, gap_end in self._gaps(len(text), sorted(claimed)):
+            for match in self.combined_pattern.finditer(text[gap_start:gap_end]):
+                found.append((gap_start + match.start(), gap_start + match.end(), match.lastgroup))
+        return found
 
-        # Sort spans descending by start_char to avoid messing offsets when replacing
-        spans = sorted(spans, key=lambda x: x[0], reverse=True)
+    @staticmethod
+    def _gaps(length: int, spans: List[Tuple[int, int, str]]):
+        position = 0
+        for start, end, _ in spans:
+            if start > position:
+                yield position, start
+            position = max(position, end)
+        if position < length:
+            yield position, length
 
-        for start, end, label, original_text in spans:
+    def _apply_entities(self, text: str, spans: Tuple[Tuple[int, int, str], ...]) -> str:
+        """Replace each span with a fresh token, building the result in one join."""
+        if not spans:
+            return text
+        parts = []
+        position = 0
+        for start, end, label in spans:
             mask_token = self._get_mask_token(label)
-            self.mapping[mask_token] = original_text
-            text = text[:start] + mask_token + text[end:]
-
-        return text
-
-    def _mask_regex_patterns(self, text: str) -> str:
-        for label, pattern in self.patterns.items():
-            matches = list(pattern.finditer(text))
-            for match in reversed(matches):  # reverse for safe replacement
-                value = match.group()
-                mask_token = self._get_mask_token(label)
-                self.mapping[mask_token] = value
-                start, end = match.start(), match.end()
-                text = text[:start] + mask_token + text[end:]
-        return text
+            self.mapping[mask_token] = text[start:end]
+            parts.append(text[position:start])
+            parts.append(mask_token)
+            position = end
+        parts.append(text[position:])
+        return "".join(parts)
+
+    def cache_info(self) -> Dict[str, int]:
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "size": len(self.entity_cache),
+            "max_size": self.cache_size,
+        }
 
     def _get_mask_token(self, label: str) -> str:
         count = self.counter.get(label, 0)
@@ -111,11 +240,7 @@ class JSONPIIMasker:
         self.mapping = {}
         self.counter = {}
 
-        # Mask spaCy entities
-        masked_text = self._mask_spacy_entities(text)
-        # Mask regex patterns on the updated text
-        masked_text = self._mask_regex_patterns(masked_text)
-
+        masked_text = self._mask_string(text)
         return masked_text, self.mapping
     
     
@@ -40,6 +40,12 @@ Instructions:
 
 """
 
+SCHEMA_DIGEST_PROMPT = """
+The collections and fields of the database are summarized below. Use this digest instead of listing the collections or fetching schemas (this replaces instruction 1), and write the aggregation query directly. Only call the schema tool if a field you need is not in the digest.
+
+{digest}
+"""
+
 MONGODB_SUFFIX = """Begin!
 
 Question: {input}
@@ -2,9 +2,11 @@ from JSONPIIMasker import JSONPIIMasker
 from langchain_mongodb.agent_toolkit import MongoDBDatabase
 
 class MaskingMongoDBDatabase(MongoDBDatabase):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, masker=None, **kwargs):
         super().__init__(*args, **kwargs)
-        self.masker = JSONPIIMasker()
+        # The spaCy model behind JSONPIIMasker is shared process-wide, so
+        # building one masker per wrapper no longer reloads it
+        self.masker = masker or JSONPIIMasker()
 
     def _find(self, collection_name, filter, projection=None, sort=None, limit=None):
         # Call the original _find method to get results
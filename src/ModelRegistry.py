@@ -0,0 +1,81 @@
+"""
+Process-wide registry for the NER models used by the PII maskers.
+
+spaCy pipelines and the Presidio analyzer cost hundreds of MB and several
+seconds to load. Every masker asks this module for its model instead of
+loading its own, so each model is loaded once per process on first use
+(or up front through `warm_up()`) and shared by all masker instances.
+
+The spaCy model is chosen with the PII_SPACY_MODEL environment variable:
+"sm", "lg" or a full package name such as "en_core_web_md" (default "lg").
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional
+
+SPACY_MODELS = {
+    "sm": "en_core_web_sm",
+    "lg": "en_core_web_lg",
+}
+DEFAULT_SPACY_MODEL = os.getenv("PII_SPACY_MODEL", "lg")
+
+_lock = threading.Lock()
+_spacy_models: Dict[str, Any] = {}
+_presidio_analyzers: Dict[str, Any] = {}
+
+
+def resolve_spacy_model(model: Optional[str] = None) -> str:
+    """Map a size alias ("sm"/"lg") or package name to a spaCy package name."""
+    model = model or DEFAULT_SPACY_MODEL
+    return SPACY_MODELS.get(model, model)
+
+
+def get_spacy_model(model: Optional[str] = None):
+    """Return the shared spaCy pipeline, loading it on first use."""
+    name = resolve_spacy_model(model)
+    nlp = _spacy_models.get(name)
+    if nlp is None:
+        with _lock:
+            nlp = _spacy_models.get(name)
+            if nlp is None:
+                import spacy
+
+                print(f"Loading spaCy model {name}...")
+                nlp = spacy.load(name)
+                _spacy_models[name] = nlp
+    return nlp
+
+
+def get_presidio_analyzer(model: Optional[str] = None):
+    """Return the shared Presidio AnalyzerEngine.
+
+    The analyzer runs on the same spaCy pipeline instance that
+    `get_spacy_model` hands out, so using both maskers costs one model.
+    """
+    name = resolve_spacy_model(model)
+    analyzer = _presidio_analyzers.get(name)
+    if analyzer is None:
+        nlp = get_spacy_model(name)
+        with _lock:
+            analyzer = _presidio_analyzers.get(name)
+            if analyzer is None:
+                from presidio_analyzer import AnalyzerEngine
+                from presidio_analyzer.nlp_engine import SpacyNlpEngine
+
+                nlp_engine = SpacyNlpEngine(models=[{"lang_code": "en", "model_name": name}])
+                # Hand over the already loaded pipeline instead of letting
+                # Presidio call spacy.load() a second time
+                nlp_engine.nlp = {"en": nlp}
+                analyzer = AnalyzerEngine(nlp_engine=nlp_engine, supported_languages=["en"])
+                _presidio_analyzers[name] = analyzer
+    return analyzer
+
+
+def warm_up(model: Optional[str] = None, presidio: bool = False) -> None:
+    """Load the models eagerly, e.g. at service startup, and run one tiny doc
+    through them so the first real request does not pay any lazy setup."""
+    nlp = get_spacy_model(model)
+    nlp("Warm up for John Doe in Mumbai.")
+    if presidio:
+        get_presidio_analyzer(model).analyze(text="Warm up for John Doe.", language="en")
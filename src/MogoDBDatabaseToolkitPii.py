@@ -2,11 +2,26 @@ from langchain_mongodb.agent_toolkit import (
     MONGODB_AGENT_SYSTEM_PROMPT,
     MongoDBDatabase,
 )
-from bson.json_util import dumps
 from RegexPIIMasker import FieldBasedPIIMasker
-from typing import Any, Dict, List, Optional , Union
+from ShadowCollections import StableTokenMasker, is_internal_collection, shadow_name
+from HRRollups import is_rollup_collection, rollup_description
+from AggregationCache import AggregationCache
+from QueryCostGuard import PipelineRejected, QueryCostGuard
+from ResultSummary import ResultStore, summarize, summary_text
+from ResultFormatter import OUTPUT_FORMATS, count_tokens, format_document, format_results
+from Tracing import span
+from typing import Any, Dict, Iterable, Iterator, List, Optional , Tuple, Union
+import bson
+import json
+import os
 from pymongo.cursor import Cursor
 from pymongo import MongoClient
+from pymongo.errors import ExecutionTimeout
+
+# Stages that may need to spill to disk on large inputs
+BLOCKING_STAGES = {"$group", "$sort", "$bucket", "$bucketAuto", "$setWindowFields", "$facet", "$sortByCount"}
+# Stages that write; never run on behalf of the agent
+WRITE_STAGES = {"$out", "$merge"}
 
 
 class MongoDBDatabasePIIToolkit(MongoDBDatabase):
@@ -21,6 +36,24 @@ class MongoDBDatabasePIIToolkit(MongoDBDatabase):
         include_collections: Optional[List[str]] = None,
         sample_docs_in_collection_info: int = 3,
         indexes_in_collection_info: bool = False,
+        stream_results: bool = False,
+        cursor_batch_size: int = 100,
+        max_result_docs: Optional[int] = None,
+        max_result_bytes: Optional[int] = None,
+        use_shadow_collections: bool = False,
+        max_time_ms: Optional[int] = None,
+        allow_disk_use: Optional[bool] = None,
+        output_format: str = "json",
+        result_cache: Optional[AggregationCache] = None,
+        prewarm_collection_info: bool = False,
+        collection_info_cache_path: Optional[str] = None,
+        cost_guard: Optional[QueryCostGuard] = None,
+        read_preference: Optional[Any] = None,
+        summarize_over_docs: Optional[int] = None,
+        summarize_over_bytes: Optional[int] = None,
+        summary_rows: int = 10,
+        result_store: Optional[ResultStore] = None,
+        collection_info: Optional[Dict[str, str]] = None,
     ):
         super().__init__(
             client,
@@ -31,20 +64,228 @@ class MongoDBDatabasePIIToolkit(MongoDBDatabase):
             sample_docs_in_collection_info,
             indexes_in_collection_info,
         )
+        if read_preference is not None:
+            # e.g. secondaryPreferred, so analytic queries stay off the primary
+            self._db = client.get_database(database, read_preference=read_preference)
         self.piiMasker = pii_masker
+        # Streaming options: pull the cursor in batches of `cursor_batch_size`,
+        # mask each document as it arrives and stop once either budget is hit.
+        self.stream_results = stream_results
+        self.cursor_batch_size = cursor_batch_size
+        self.max_result_docs = max_result_docs
+        self.max_result_bytes = max_result_bytes
+        self.last_run_truncated = False
+        # Server-side guards: `max_result_docs` also becomes a terminal $limit,
+        # `max_time_ms` is sent as maxTimeMS and `allow_disk_use=None` lets
+        # the toolkit enable allowDiskUse only for blocking stages.
+        self.max_time_ms = max_time_ms
+        self.allow_disk_use = allow_disk_use
+        # Shadow mode: read the pseudonymized copies built by ShadowCollections
+        # at ingest time. Pass a VaultTokenResolver as `pii_masker` so results
+        # are not masked again and only the final answer is resolved.
+        self.use_shadow_collections = use_shadow_collections
+        # Rewrites raw PII literals in $match filters to the shadow tokens
+        self.shadow_tokens = StableTokenMasker() if use_shadow_collections else None
+        # How results and sample documents are serialized for the LLM, see
+        # ResultFormatter; "json" keeps the original indented Extended JSON.
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format {output_format!r}; expected one of {OUTPUT_FORMATS}")
+        self.output_format = output_format
+        self.last_result_tokens = 0
+        # Raw results of earlier runs, keyed by collection + pipeline hash;
+        # results are masked on every read, never stored masked.
+        self.result_cache = result_cache
+        # Masked schema + sample description per collection, built once and
+        # served from memory; optionally persisted to `collection_info_cache_path`
+        # and reused while the collection's stats are unchanged.
+        self.collection_info_cache_path = collection_info_cache_path
+        # Optional explain-based pre-flight check; rejected pipelines reach
+        # the agent as a JSON hint instead of running
+        self.cost_guard = cost_guard
+        # Adaptive mode: results over either threshold are returned as a
+        # summary (see ResultSummary) and kept in full in `result_store`;
+        # `max_result_docs` still caps what is fetched and stored.
+        self.summarize_over_docs = summarize_over_docs
+        self.summarize_over_bytes = summarize_over_bytes
+        self.summary_rows = summary_rows
+        self.result_store = result_store
+        self.last_result_handle: Optional[str] = None
+        # Documents returned by the last non-streaming run, before truncation
+        self.last_result_count: Optional[int] = None
+        # Pass another toolkit's `collection_info` to share one warmed copy
+        self._collection_info: Dict[str, str] = collection_info if collection_info is not None else {}
+        if prewarm_collection_info:
+            self.warm_collection_info()
+
+    def get_usable_collection_names(self) -> List[str]:
+        return [
+            name for name in super().get_usable_collection_names()
+            if not is_internal_collection(name)
+        ]
+
+    def get_collection_info(self, collection_names: Optional[List[str]] = None) -> str:
+        """Same output as MongoDBDatabase.get_collection_info, one cached block per collection."""
+        all_coll_names = self.get_usable_collection_names()
+        if collection_names is not None:
+            missing_collections = set(collection_names).difference(all_coll_names)
+            if missing_collections:
+                raise ValueError(
+                    f"collection_names {missing_collections} not found in database"
+                )
+            all_coll_names = collection_names
+
+        colls = []
+        for coll in all_coll_names:
+            info = self._collection_info.get(coll)
+            if info is None:
+                info = self._describe_collection(coll)
+                self._collection_info[coll] = info
+            colls.append(info)
+        colls.sort()
+        return "\n\n".join(colls)
+
+    def warm_collection_info(self) -> None:
+        """Build the description of every usable collection, reusing the disk
+        cache for collections whose stats have not changed since it was written."""
+        stored = self._load_collection_info_cache()
+        entries = {}
+        built = 0
+        for coll in self.get_usable_collection_names():
+            fingerprint = self._collection_fingerprint(coll)
+            entry = stored.get(coll)
+            if fingerprint is not None and entry and entry.get("fingerprint") == fingerprint:
+                info = entry["info"]
+            else:
+                info = self._describe_collection(coll)
+                built += 1
+            self._collection_info[coll] = info
+            entries[coll] = {"fingerprint": fingerprint, "info": info}
+        print(f"Collection info ready: {len(entries)} collections ({built} rebuilt)")
+        if built:
+            self._save_collection_info_cache(entries)
+
+    def _describe_collection(self, collection: str) -> str:
+        info = super().get_collection_info([collection])
+        description = rollup_description(collection)
+        if description:
+            info = info.replace(
+                f"Collection name: {collection}\n",
+                f"Collection name: {collection}\nDescription: {description}\n",
+                1,
+            )
+        return info
+
+    @property
+    def collection_info_cache(self) -> Dict[str, str]:
+        return self._collection_info
+
+    def invalidate_collection_info(self, collection: Optional[str] = None) -> None:
+        if collection is None:
+            self._collection_info.clear()
+        else:
+            self._collection_info.pop(collection, None)
+
+    def _collection_info_settings(self) -> Dict[str, Any]:
+        """Everything besides the data that changes the rendered description."""
+        return {
+            "database": self._db.name,
+            "masker": type(self.piiMasker).__name__,
+            "sample_docs": self._sample_docs_in_coll_info,
+            "indexes": self._indexes_in_coll_info,
+            "output_format": self.output_format,
+            "shadow": self.use_shadow_collections,
+        }
+
+    def _collection_fingerprint(self, collection: str) -> Optional[Dict[str, Any]]:
+        """Document count and data size of the collection the samples come from."""
+        try:
+            stats = next(
+                self._physical_collection(collection).aggregate([{"$collStats": {"storageStats": {}}}]),
+                {},
+            ).get("storageStats", {})
+        except Exception as e:
+            print(f"[W] No stats for {collection}, not caching its info on disk: {e}")
+            return None
+        return {"count": stats.get("count"), "size": stats.get("size")}
+
+    def _load_collection_info_cache(self) -> Dict[str, Dict[str, Any]]:
+        path = self.collection_info_cache_path
+        if not path or not os.path.exists(path):
+            return {}
+        try:
+            with open(path, encoding="utf-8") as fh:
+                cached = json.load(fh)
+        except (OSError, ValueError) as e:
+            print(f"[W] Ignoring unreadable collection info cache {path}: {e}")
+            return {}
+        if cached.get("settings") != self._collection_info_settings():
+            return {}
+        return cached.get("collections", {})
+
+    def _save_collection_info_cache(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        path = self.collection_info_cache_path
+        if not path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump({"settings": self._collection_info_settings(), "collections": entries}, fh, indent=2)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _shadow_name(collection: str) -> str:
+        # Rollups hold only counts, so they are read directly in shadow mode too
+        return collection if is_rollup_collection(collection) else shadow_name(collection)
+
+    def _physical_collection(self, collection: str):
+        if self.use_shadow_collections:
+            return self._db[self._shadow_name(collection)]
+        return self._db[collection]
+
+    def _shadow_pipeline(self, stages: Any) -> Any:
+        """Point $lookup/$graphLookup/$unionWith at the shadow copies too, so a
+        join can never pull raw documents into a shadow-mode result, and
+        tokenize PII equality literals in $match filters."""
+        if isinstance(stages, list):
+            return [self._shadow_pipeline(stage) for stage in stages]
+        if not isinstance(stages, dict):
+            return stages
+        rewritten = {}
+        for key, value in stages.items():
+            if key in ("$lookup", "$graphLookup") and isinstance(value, dict):
+                value = dict(value)
+                if isinstance(value.get("from"), str):
+                    value["from"] = self._shadow_name(value["from"])
+                if "pipeline" in value:
+                    value["pipeline"] = self._shadow_pipeline(value["pipeline"])
+            elif key == "$unionWith":
+                if isinstance(value, str):
+                    value = self._shadow_name(value)
+                elif isinstance(value, dict):
+                    value = dict(value)
+                    value["coll"] = self._shadow_name(value["coll"])
+                    if "pipeline" in value:
+                        value["pipeline"] = self._shadow_pipeline(value["pipeline"])
+            elif key == "$facet" and isinstance(value, dict):
+                value = {name: self._shadow_pipeline(sub) for name, sub in value.items()}
+            elif key == "$match" and isinstance(value, dict):
+                value = self.shadow_tokens.tokenize_filter(value)
+            rewritten[key] = value
+        return rewritten
+
     # overridde the _get_sample_docs method to add PII masking
 
     def _get_sample_docs(self, collection: str) -> str:
-        col = self._db[collection]
+        col = self._physical_collection(collection)
         docs = list(col.find({}, limit=self._sample_docs_in_coll_info))
         for doc in docs:
             self._elide_doc(doc)
-        docs, _ = self.piiMasker.mask(docs)
+        docs, _ = self.piiMasker.mask(docs, collection=collection)
         # print("sample docs in coll info" ,self._sample_docs_in_coll_info)
         # print("sample docs",docs)
         return (
             f"{self._sample_docs_in_coll_info} documents from {collection} collection:\n"
-            f"{dumps(docs, indent=2)}"
+            f"{format_results(docs, self.output_format)}"
         )
     
     def run(self, command: str) -> Union[str, Cursor]:
@@ -73,18 +314,253 @@ class MongoDBDatabasePIIToolkit(MongoDBDatabase):
 
         # Parse pipeline using helper
         agg_pipeline = self._parse_command(command)
+        if self.use_shadow_collections:
+            agg_pipeline = self._shadow_pipeline(agg_pipeline)
 
+        if self.stream_results:
+            self.last_result_count = None
+            return self._report_tokens("".join(self.iter_run(col_name, agg_pipeline))) + self._truncation_notice()
+
+        self.last_run_truncated = False
         try:
-            coll = self._db[col_name]
-            print("Aggregation Pipeline:" , agg_pipeline)
-            result = coll.aggregate(agg_pipeline)
-            result_list = list(result)
+            with span("mongo.aggregate", collection=col_name, stages=len(agg_pipeline)) as s:
+                result_list = self._cached_results(col_name, agg_pipeline)
+                s.set(cached=result_list is not None)
+                if result_list is None:
+                    result_list = list(self._aggregate(col_name, agg_pipeline))
+                    if self.result_cache is not None:
+                        self.result_cache.put(
+                            col_name, self._limit_pipeline(agg_pipeline), result_list, self._result_cache_scope
+                        )
+                s.set(docs_returned=len(result_list))
             # print("Aggregation Result:" , result_list)
-            masked_result, mapping = self.piiMasker.mask(result_list)
-            # print("Masked Aggregation Result:" , masked_result)
-            return dumps(list(masked_result), indent=2)
+            output, self.last_run_truncated = self._mask_and_format(self.piiMasker, col_name, result_list, agg_pipeline)
+            return self._report_tokens(output) + self._truncation_notice()
+        except PipelineRejected:
+            raise
+        except ExecutionTimeout as e:
+            raise ValueError(
+                f"Aggregation exceeded the {self.max_time_ms} ms time limit; "
+                "add a selective $match or reduce the work in the pipeline."
+            ) from e
         except Exception as e:
             # print("Error executing aggregation:", e)
             raise ValueError(f"Error executing aggregation: {e}") from e
-        
 
+    def _mask_and_format(
+        self,
+        masker,
+        col_name: str,
+        result_list: List[Dict[str, Any]],
+        agg_pipeline: List[Dict[str, Any]],
+    ) -> Tuple[str, bool]:
+        """Mask and serialize a result, or a summary of it if it is oversized.
+
+        Returns the text for the agent and whether `max_result_docs` cut it.
+        """
+        self.last_result_handle = None
+        self.last_result_count = len(result_list)
+        truncated = self.max_result_docs is not None and len(result_list) > self.max_result_docs
+        if truncated:
+            result_list = result_list[: self.max_result_docs]
+
+        with span("pii.mask", collection=col_name, docs=len(result_list)) as s:
+            if self._is_oversized(result_list):
+                handle = None
+                if self.result_store is not None:
+                    handle = self.result_store.put(result_list, col_name, agg_pipeline, truncated)
+                    self.last_result_handle = handle
+                masked_summary, mapping = masker.mask(summarize(result_list, self.summary_rows), collection=col_name)
+                s.set(summarized=True, masked_fields=len(mapping))
+                return summary_text(masked_summary, handle, truncated), truncated
+
+            masked_result, mapping = masker.mask(result_list, collection=col_name)
+            s.set(summarized=False, masked_fields=len(mapping))
+        output = format_results(list(masked_result), self.output_format, keep_object_id=self._projects_id(agg_pipeline))
+        return output, truncated
+
+    def _is_oversized(self, result_list: List[Dict[str, Any]]) -> bool:
+        if self.summarize_over_docs is not None and len(result_list) > self.summarize_over_docs:
+            return True
+        if self.summarize_over_bytes is not None:
+            size = 0
+            for doc in result_list:
+                size += len(bson.encode(doc))
+                if size > self.summarize_over_bytes:
+                    return True
+        return False
+
+    def _cached_results(self, col_name: str, agg_pipeline: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """Raw result of an earlier identical run, if the cache still holds it.
+
+        The key is the pipeline as it is sent to the server, i.e. including
+        the guard $limit, so toolkits with different limits can share a cache.
+        Entries are scoped by database and raw/shadow mode, see
+        `_result_cache_scope`.
+        """
+        if self.result_cache is None:
+            return None
+        cached = self.result_cache.get(col_name, self._limit_pipeline(agg_pipeline), self._result_cache_scope)
+        if cached is not None:
+            print("Aggregation cache hit:", col_name)
+        return cached
+
+    @property
+    def _result_cache_scope(self) -> str:
+        # Raw-mode entries hold unmasked PII; a shadow-mode toolkit must never read them
+        return f"{self._db.name}:{'shadow' if self.use_shadow_collections else 'raw'}"
+
+    def _aggregate(self, col_name: str, agg_pipeline: List[Dict[str, Any]]):
+        """Run the pipeline with the configured limit, time budget and cursor options."""
+        agg_pipeline = self._limit_pipeline(agg_pipeline)
+        coll = self._physical_collection(col_name)
+        print("Aggregation Pipeline:" , agg_pipeline)
+        if self.cost_guard is not None:
+            report = self.cost_guard.check(coll, agg_pipeline)
+            print("Query cost:", report)
+        return coll.aggregate(agg_pipeline, **self._aggregate_options(agg_pipeline))
+
+    def _aggregate_options(self, agg_pipeline: List[Dict[str, Any]]) -> Dict[str, Any]:
+        options: Dict[str, Any] = {"batchSize": self.cursor_batch_size}
+        if self.max_time_ms is not None:
+            options["maxTimeMS"] = self.max_time_ms
+        allow_disk_use = self.allow_disk_use
+        if allow_disk_use is None:
+            allow_disk_use = any(
+                stage_name in BLOCKING_STAGES
+                for stage in agg_pipeline
+                for stage_name in stage
+            )
+        if allow_disk_use:
+            options["allowDiskUse"] = True
+        return options
+
+    def _limit_pipeline(self, agg_pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Append or tighten a terminal $limit of `max_result_docs` + 1.
+
+        The extra document is fetched only to tell whether the limit cut
+        the result; it is dropped before masking.
+        """
+        if any(stage_name in WRITE_STAGES for stage in agg_pipeline for stage_name in stage):
+            raise ValueError("$out and $merge stages are not allowed; only read-only aggregations can run.")
+        if self.max_result_docs is None:
+            return agg_pipeline
+
+        guard = self.max_result_docs + 1
+        if agg_pipeline and "$limit" in agg_pipeline[-1]:
+            requested = agg_pipeline[-1]["$limit"]
+            if isinstance(requested, int) and requested <= guard:
+                return agg_pipeline
+            return agg_pipeline[:-1] + [{"$limit": guard}]
+        return agg_pipeline + [{"$limit": guard}]
+
+    @staticmethod
+    def _projects_id(agg_pipeline: List[Dict[str, Any]]) -> bool:
+        """Whether the pipeline explicitly asks for `_id` in a $project."""
+        return any(
+            isinstance(stage.get("$project"), dict) and stage["$project"].get("_id") not in (None, 0, False)
+            for stage in agg_pipeline
+        )
+
+    def _report_tokens(self, output: str) -> str:
+        self.last_result_tokens = count_tokens(output)
+        print(f"Result tokens ({self.output_format}): {self.last_result_tokens}")
+        return output
+
+    def _truncation_notice(self, truncated: Optional[bool] = None) -> str:
+        if truncated is None:
+            truncated = self.last_run_truncated
+        if not truncated:
+            return ""
+        limits = []
+        if self.max_result_docs is not None:
+            limits.append(f"{self.max_result_docs} documents")
+        if self.max_result_bytes is not None:
+            limits.append(f"{self.max_result_bytes} bytes")
+        return (
+            f"\n\nNote: the result was truncated at the toolkit's limit of {' / '.join(limits)}. "
+            "Aggregate with $group/$count or add a $match to narrow the result."
+        )
+
+    def iter_run(self, col_name: str, agg_pipeline: List[Dict[str, Any]]) -> Iterator[str]:
+        """Stream the masked aggregation result in the configured output format.
+
+        The cursor is consumed `cursor_batch_size` documents at a time and each
+        document is masked and serialized as soon as it arrives, so neither the
+        raw nor the masked result set is ever held in memory as a whole.
+        Iteration stops early once `max_result_docs` documents or
+        `max_result_bytes` UTF-8 bytes have been produced; the emitted text is
+        always a complete JSON array. The "columnar" and "table" formats need
+        every column before the first row, so they are written in one chunk
+        after masking (the document budget still applies).
+
+        With a result cache, a hit is streamed from the cached documents and
+        a miss is stored only if the cursor was read to the end.
+        """
+        self.last_run_truncated = False
+        cursor = None
+        try:
+            source = self._cached_results(col_name, agg_pipeline)
+            if source is None:
+                cursor = self._aggregate(col_name, agg_pipeline)
+                source = self._caching_iter(cursor, col_name, agg_pipeline)
+        except PipelineRejected:
+            raise
+        except Exception as e:
+            raise ValueError(f"Error executing aggregation: {e}") from e
+
+        keep_object_id = self._projects_id(agg_pipeline)
+        try:
+            if self.output_format in ("columnar", "table"):
+                # Both need the full column set before the first row
+                docs = list(self._iter_masked_docs(source, col_name))
+                yield format_results(docs, self.output_format, keep_object_id)
+            else:
+                yield from self._write_json_stream(self._iter_masked_docs(source, col_name), keep_object_id)
+        except Exception as e:
+            raise ValueError(f"Error executing aggregation: {e}") from e
+        finally:
+            if cursor is not None:
+                cursor.close()
+
+    def _caching_iter(self, cursor, col_name: str, agg_pipeline: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Pass the cursor through, storing the result once it is exhausted."""
+        if self.result_cache is None:
+            yield from cursor
+            return
+        docs = []
+        for doc in cursor:
+            if len(docs) <= self.result_cache.max_entry_docs:
+                docs.append(doc)
+            yield doc
+        self.result_cache.put(col_name, self._limit_pipeline(agg_pipeline), docs, self._result_cache_scope)
+
+    def _iter_masked_docs(self, docs: Iterable[Dict[str, Any]], col_name: str) -> Iterator[Dict[str, Any]]:
+        """Mask documents one by one, sharing a single token mapping."""
+        self.piiMasker.reset()
+        for count, doc in enumerate(docs):
+            if self.max_result_docs is not None and count >= self.max_result_docs:
+                self.last_run_truncated = True
+                return
+            masked_doc, _ = self.piiMasker.mask(doc, reset=False, collection=col_name)
+            yield masked_doc
+
+    def _write_json_stream(self, docs: Iterable[Dict[str, Any]], keep_object_id: bool = False) -> Iterator[str]:
+        """Serialize documents into a compact JSON array, one chunk per document."""
+        written = 1
+        yield "["
+        for index, doc in enumerate(docs):
+            chunk = format_document(doc, self.output_format, keep_object_id)
+            if index:
+                chunk = "," + chunk
+            size = len(chunk.encode("utf-8"))
+            if (
+                self.max_result_bytes is not None
+                and index
+                and written + size + 1 > self.max_result_bytes
+            ):
+                self.last_run_truncated = True
+                break
+            written += size
+            yield chunk
+        yield "]"
@@ -1,13 +1,29 @@
 import os
 import json
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional
+from langchain_core.messages import AIMessage
+from langchain_core.messages.utils import count_tokens_approximately, trim_messages
 from langchain_openai import ChatOpenAI
+from langgraph.errors import GraphRecursionError
 from langgraph.prebuilt import create_react_agent
 from langchain_mongodb.agent_toolkit import (
     MongoDBDatabaseToolkit,
 )
-from MONGODB_AGENT_SYS_PROMPT import MONGODB_AGENT_SYSTEM_PROMPT
+from MONGODB_AGENT_SYS_PROMPT import MONGODB_AGENT_SYSTEM_PROMPT, SCHEMA_DIGEST_PROMPT
 from MogoDBDatabaseToolkitPii import MongoDBDatabasePIIToolkit
-from RegexPIIMasker import FieldBasedPIIMasker
+from RegexPIIMasker import TOKEN_PATTERN, FieldBasedPIIMasker
+from AggregationCache import AggregationCache
+from QueryCostGuard import QueryCostGuard
+from HRRollups import rollup_prompt
+from ResultSummary import ResultStore
+from ResultFormatter import count_tokens
+from MongoClientManager import analytics_read_preference, get_client
+from SemanticQueryCache import SemanticQueryCache
+from QueryTemplates import match_template, usable_templates
+from SchemaDigest import build_schema_digest
+from Tracing import TracingCallbackHandler, span, start_span, use_span
 
 # Load environment variables from .env file
 from dotenv import load_dotenv
@@ -16,6 +32,52 @@ load_dotenv(os.path.join(app_dir, ".env"))
 
 MONGODB_URI = os.getenv('MONGODB_URI')
 DB_NAME = 'hr'
+# Execution limits for agent-generated pipelines
+MAX_RESULT_DOCS = 5000
+# Larger results reach the agent as a summary; the full result stays in RESULT_STORE
+SUMMARIZE_OVER_DOCS = 200
+# Server-side limit per mongodb_query call, i.e. the query tool's timeout
+MAX_TIME_MS = 20000
+# Per-request limit of each LLM call (agent turns and the query checker tool)
+LLM_TIMEOUT_S = 30
+# Pipelines estimated (via explain) to examine more documents are rejected.
+# The largest hr collection (base_report) has ~7,900 documents, so any single
+# scan passes; a $lookup is outer documents x foreign count, e.g. all of
+# base_report joined to leave_transaction (~3,900) is ~30M and is rejected.
+MAX_DOCS_EXAMINED = 500000
+# Serialization of query results for the LLM, see ResultFormatter
+RESULT_FORMAT = "columnar"
+# Raw aggregation results shared by all agent instances in this process,
+# scoped per database and raw/shadow mode. Ingest runs in other processes,
+# so a reloaded collection is served stale for at most `default_ttl` seconds
+RESULT_CACHE = AggregationCache(max_entries=256, default_ttl=600)
+# Full results of summarized queries, for export by handle
+RESULT_STORE = ResultStore(max_entries=32, ttl=3600)
+# Masked collection descriptions, rebuilt only when a collection's stats change
+COLLECTION_INFO_CACHE = os.path.join(app_dir, "Outputs", "cache", "collection_info.json")
+# Token budget of the schema digest embedded in the system prompt
+SCHEMA_DIGEST_TOKENS = 2000
+# Graph nodes whose updates carry new messages (hooks return the whole history)
+STREAMED_NODES = ("agent", "tools")
+QUERY_TOOL = "mongodb_query"
+# Masked question -> last successful mongodb_query command, shared by all
+# agent instances; similar questions rerun the command without the LLM
+QUERY_CACHE = SemanticQueryCache(threshold=0.95)
+
+
+@dataclass(frozen=True)
+class AgentBudget:
+    """Per-request limits of an agent run.
+
+    `deadline_s` is checked between graph steps, so a run can overshoot it
+    by one LLM call (LLM_TIMEOUT_S) or one query (MAX_TIME_MS) at most.
+    """
+    max_steps: int = 8              # model calls
+    deadline_s: float = 90.0        # wall clock for the whole run
+    max_prompt_tokens: int = 16000  # system prompt + messages sent to the model
+
+
+DEFAULT_BUDGET = AgentBudget()
 # NATURAL_LANGUAGE_QUERY = 'how many people have joined the organisation and resigned at the same year'
 # NATURAL_LANGUAGE_QUERY = 'Give me the list of 10  people who have resigned involuntary in the year 2022 from the west region and  return there employee code , first name , last name and email address only'
 # NATURAL_LANGUAGE_QUERY = 'what is the designation of Vikram Kaushik and is he currently with the company?'
@@ -36,16 +98,37 @@ NATURAL_LANGUAGE_QUERY = "what are the list of things that are needed to be done
 
 
 class NaturalLanguageToMQL:
-    def __init__(self):
+    def __init__(self, llm=None, client=None, collection_info=None, schema_digest=None, templates=None):
+        """`llm`, `client`, `collection_info` (another instance's
+        `db_wrapper.collection_info_cache`), `schema_digest` and `templates`
+        can be shared between instances, see AgentService; by default each
+        instance builds its own."""
         # self.llm = ChatOpenAI(model="gpt-5")
         # self.llm = ChatOpenAI(model="gpt-4-turbo")
-        self.llm = ChatOpenAI(model="gpt-4o")
-        self.system_message = MONGODB_AGENT_SYSTEM_PROMPT.format(top_k=50)
+        self.llm = llm or ChatOpenAI(model="gpt-4o", timeout=LLM_TIMEOUT_S, max_retries=1)
         self.pii_masker = FieldBasedPIIMasker()
-        self.db_wrapper = MongoDBDatabasePIIToolkit.from_connection_string(
-            MONGODB_URI,
-            database=DB_NAME,
+        self.db_wrapper = MongoDBDatabasePIIToolkit(
+            client or get_client(MONGODB_URI),
+            DB_NAME,
             pii_masker=self.pii_masker,
+            max_result_docs=MAX_RESULT_DOCS,
+            max_time_ms=MAX_TIME_MS,
+            output_format=RESULT_FORMAT,
+            result_cache=RESULT_CACHE,
+            prewarm_collection_info=collection_info is None,
+            collection_info_cache_path=COLLECTION_INFO_CACHE,
+            collection_info=collection_info,
+            cost_guard=QueryCostGuard(max_docs_examined=MAX_DOCS_EXAMINED),
+            read_preference=analytics_read_preference(),
+            summarize_over_docs=SUMMARIZE_OVER_DOCS,
+            result_store=RESULT_STORE,
+        )
+        self.schema_digest = schema_digest if schema_digest is not None else \
+            build_schema_digest(self.db_wrapper, token_budget=SCHEMA_DIGEST_TOKENS)
+        self.system_message = (
+            MONGODB_AGENT_SYSTEM_PROMPT.format(top_k=50)
+            + SCHEMA_DIGEST_PROMPT.format(digest=self.schema_digest)
+            + rollup_prompt()
         )
         self.toolkit = MongoDBDatabaseToolkit(db=self.db_wrapper, llm=self.llm)
 
@@ -53,12 +136,41 @@ class NaturalLanguageToMQL:
             model=self.llm,
             tools=self.toolkit.get_tools(),
             prompt=self.system_message,
+            pre_model_hook=self.budget_pre_model_hook,
             # pre_model_hook=self.pii_masking_pre_model_hook,
             # post_model_hook=self.pii_unmask_post_model_hook
         )
 
+        self.system_tokens = count_tokens(self.system_message)
+        self.budget = DEFAULT_BUDGET
+        self.use_templates = True
+        # QueryTemplates whose fields exist in the loaded collections
+        self.templates = templates if templates is not None else usable_templates(self.db_wrapper)
+        self.query_cache = QUERY_CACHE
         self.messages = []
 
+    def budget_pre_model_hook(self, state: dict) -> dict:
+        """Keep the model input within `budget.max_prompt_tokens`.
+
+        The question is always kept; older turns are dropped from the front,
+        starting the kept part at an AI message so tool results stay paired
+        with their calls. The graph state itself is not changed.
+        """
+        messages = state["messages"]
+        budget = self.budget.max_prompt_tokens - self.system_tokens
+        if count_tokens_approximately(messages) <= budget:
+            return {"llm_input_messages": messages}
+        head = messages[:1]
+        tail = trim_messages(
+            messages[1:],
+            max_tokens=budget - count_tokens_approximately(head),
+            token_counter=count_tokens_approximately,
+            strategy="last",
+            start_on="ai",
+        )
+        print(f"[AgentBudget] trimmed {len(messages) - 1 - len(tail)} messages to fit {budget} tokens")
+        return {"llm_input_messages": head + tail}
+
     def pii_masking_pre_model_hook(self, state: dict) -> dict:
         messages = state["messages"]
         new_messages = []
@@ -114,26 +226,197 @@ class NaturalLanguageToMQL:
 
         return {"messages": unmasked_messages}
 
-    def convert_to_mql_and_execute_query(self, query: str):
+    def convert_to_mql_and_execute_query(self, query: str, budget: Optional[AgentBudget] = None):
+        for _ in self.stream_events(query, tokens=False, budget=budget):
+            pass
+
+    def stream_events(
+        self, query: str, tokens: bool = True, budget: Optional[AgentBudget] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Run the agent and yield what is new as it happens:
+
+            {"type": "token", "content": ...}        answer text (with `tokens`)
+            {"type": "tool_call", "name": ..., "args": {...}}
+            {"type": "tool_result", "name": ..., "content": ...}
+            {"type": "answer", "content": ...}       final, unmasked answer
+
+        Only the agent and tool node updates are read, so each message is
+        seen (and appended to `self.messages`) once. Token and answer text
+        is unmasked; tool call args and results stay masked.
+
+        Questions matching a QueryTemplates pattern or a QUERY_CACHE entry
+        skip the agent: the command runs directly and its tool_call event
+        carries a "source".
+
+        When the run exceeds its `budget` (default DEFAULT_BUDGET) it is
+        stopped, a {"type": "budget_exceeded", "reason": ...} event is
+        yielded, and the answer is the last query result or an error text.
+        """
+        # agent.run is current only while a step runs, never across a yield:
+        # the consumer's own spans are not parented under it, and closing the
+        # generator from another context leaves no stale current span behind
+        s = start_span("agent.run", request_type="agent")
+        events = self._stream_events(query, tokens, budget)
+        try:
+            while True:
+                with use_span(s):
+                    event = next(events, None)
+                if event is None:
+                    break
+                if event["type"] == "tool_call":
+                    s.add(tool_calls=1)
+                    if "source" in event:
+                        s.set(request_type="cache" if event["source"] == "cache" else f"template:{event['source']}")
+                elif event["type"] == "budget_exceeded":
+                    s.set(budget_exceeded=event["reason"])
+                yield event
+        except GeneratorExit:
+            s.set(closed_early=True)  # the consumer stopped reading; not an error
+            raise
+        except BaseException as e:
+            s.end(e)
+            raise
+        finally:
+            with use_span(s):
+                events.close()
+            s.end()
+
+    def _stream_events(self, query: str, tokens: bool, budget: Optional[AgentBudget]) -> Iterator[Dict[str, Any]]:
         # Optional: Mask input query if needed
         masked_query, _ = self.pii_masker.mask({"query": query})
         masked_text = masked_query["query"]
 
+        if self.use_templates and (yield from self._run_template(query)):
+            return
+        if self.query_cache is not None and (yield from self._run_cached(masked_text)):
+            return
+
+        self.budget = budget or DEFAULT_BUDGET
+        deadline = time.monotonic() + self.budget.deadline_s
+        stream_mode = ["updates", "messages"] if tokens else ["updates"]
+        commands = {}  # tool_call_id -> mongodb_query command
+        last_command = None
+        last_result = None
+        exceeded = None
+        pending = ""  # token text held back while a mask token like "[EMAIL 1" is still open
         events = self.agent.stream(
             {"messages": [("user", masked_text)]},
-            stream_mode="values",
+            # pre_model_hook, agent and tools are one graph step each
+            config={"recursion_limit": 3 * self.budget.max_steps + 1, "callbacks": [TracingCallbackHandler()]},
+            stream_mode=stream_mode,
         )
+        try:
+            for mode, chunk in events:
+                if mode == "messages":
+                    message, metadata = chunk
+                    if metadata.get("langgraph_node") == "agent" and isinstance(message.content, str):
+                        pending += message.content
+                        cut = pending.rfind("[")
+                        if cut == -1 or "]" in pending[cut:]:
+                            cut = len(pending)
+                        if cut:
+                            yield {"type": "token", "content": self.pii_masker.unmask({"content": pending[:cut]})["content"]}
+                            pending = pending[cut:]
+                else:
+                    for node, update in chunk.items():
+                        if node not in STREAMED_NODES or not update:
+                            continue
+                        for message in update.get("messages", []):
+                            self.messages.append(message)
+                            if message.type == "ai":
+                                for call in message.tool_calls:
+                                    if call["name"] == QUERY_TOOL:
+                                        commands[call["id"]] = call["args"].get("query")
+                                    yield {"type": "tool_call", "name": call["name"], "args": call["args"]}
+                            elif message.type == "tool":
+                                if message.name == QUERY_TOOL and message.status != "error" \
+                                        and not str(message.content).startswith("Error"):
+                                    last_command = commands.get(message.tool_call_id) or last_command
+                                    last_result = message.content
+                                yield {"type": "tool_result", "name": message.name, "content": message.content}
+                if time.monotonic() > deadline:
+                    exceeded = f"the {self.budget.deadline_s:g}s deadline"
+                    break
+        except GraphRecursionError:
+            exceeded = f"{self.budget.max_steps} agent steps"
+        finally:
+            events.close()
+
+        if pending:
+            yield {"type": "token", "content": self.pii_masker.unmask({"content": pending})["content"]}
+        if exceeded:
+            print(f"[AgentBudget] stopped after {exceeded}")
+            yield {"type": "budget_exceeded", "reason": exceeded}
+            self.messages.append(AIMessage(content=self._partial_answer(exceeded, last_result)))
+        elif self.query_cache is not None and last_command:
+            self.query_cache.put(masked_text, last_command, self.db_wrapper._parse_command(last_command))
+        yield {"type": "answer", "content": self.final_answer()}
+
+    def _partial_answer(self, exceeded: str, last_result: Optional[str]) -> str:
+        if last_result is None:
+            return (
+                f"The question could not be answered within {exceeded}. "
+                "Please ask a narrower question (one employee, year, department or region)."
+            )
+        return (
+            f"The answer was not completed within {exceeded}. "
+            f"Result of the last query that ran:\n{last_result}"
+        )
+
+    def _run_template(self, query: str) -> Iterator[Dict[str, Any]]:
+        """Answer a QueryTemplates pattern without the agent; returns whether it did."""
+        matched = match_template(query, self.templates)
+        if matched is None:
+            return False
+        template, command, title = matched
+        print(f"[QueryTemplates] {template.name}: {command}")
+        return (yield from self._run_direct(command, title, source=template.name))
 
-        for event in events:
-            self.messages.extend(event["messages"])
+    def _run_cached(self, masked_text: str) -> Iterator[Dict[str, Any]]:
+        """Answer from QUERY_CACHE without the agent; returns whether it did."""
+        command = self.query_cache.lookup(masked_text)
+        if command is None:
+            return False
+        return (yield from self._run_direct(command, source="cache"))
+
+    def _run_direct(self, command: str, title: str = "", source: str = "") -> Iterator[Dict[str, Any]]:
+        """Run `command` through the toolkit and answer with its result.
+
+        Errors and empty results return False without yielding anything,
+        so the caller falls back to the agent.
+        """
+        try:
+            result = self.db_wrapper.run(command)
+        except Exception as e:
+            print(f"[{source}] direct command failed, using the agent: {e}")
+            return False
+        if not result or self.db_wrapper.last_result_count == 0:
+            return False
+        self.messages.append(AIMessage(content=f"{title}\n{result}" if title else result))
+        yield {"type": "tool_call", "name": QUERY_TOOL, "args": {"query": command}, "source": source}
+        yield {"type": "tool_result", "name": QUERY_TOOL, "content": result}
+        yield {"type": "answer", "content": self.final_answer()}
+        return True
+
+    def reset(self):
+        """Drop the previous question's messages and token mapping."""
+        self.messages = []
+        self.pii_masker.reset()
+
+    def final_answer(self) -> str:
+        if not self.messages:
+            return ""
+        final_output = self.messages[-1].content
+        with span("pii.unmask") as s:
+            restored = [t for t in TOKEN_PATTERN.findall(final_output) if t in self.pii_masker.mapping]
+            s.set(tokens_restored=len(restored))
+            return self.pii_masker.unmask({"content": final_output})["content"]
 
     def print_results(self):
         if self.messages:
-            final_output = self.messages[-1].content
             # print("🔒 Masked Output:")
-            # print(final_output)
-
-            unmasked_output = self.pii_masker.unmask({"content": final_output})["content"]
+            # print(self.messages[-1].content)
+            unmasked_output = self.final_answer()
             # print("\n🔓 Unmasked Output:")
             print(unmasked_output)
         else:
@@ -0,0 +1,133 @@
+"""
+Process-wide MongoDB clients.
+
+A MongoClient owns a connection pool and is safe to share between threads,
+so every component (access graph, agent toolkits, ingest jobs) gets the
+same client from here instead of creating its own: no connection handshake
+per question and a bounded number of connections under load.
+
+Settings come from the environment:
+
+    MONGODB_URI                         connection string
+    MONGO_MAX_POOL_SIZE                 default 50
+    MONGO_MIN_POOL_SIZE                 default 0
+    MONGO_MAX_IDLE_TIME_MS              default 300000
+    MONGO_CONNECT_TIMEOUT_MS            default 5000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS   default 5000
+    MONGO_SOCKET_TIMEOUT_MS             default unset (no timeout)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS         default unset (wait for a free connection)
+    MONGO_READ_PREFERENCE               client default, default "primary"
+    MONGO_ANALYTICS_READ_PREFERENCE     agent queries, default "secondaryPreferred"
+    MONGO_APP_NAME                      default "mongo-rag"
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from pymongo import MongoClient
+from pymongo.database import Database
+from pymongo.read_preferences import ReadPreference
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+_lock = threading.Lock()
+_clients: Dict[str, MongoClient] = {}
+_async_clients: Dict[str, Any] = {}
+
+
+def _env_int(name: str, default: Optional[int]) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def read_preference(name: Optional[str]):
+    if name is None:
+        return None
+    try:
+        return READ_PREFERENCES[name]
+    except KeyError:
+        raise ValueError(f"Unknown read preference {name!r}; expected one of {list(READ_PREFERENCES)}")
+
+
+def analytics_read_preference():
+    """Read preference for agent-generated analytic queries."""
+    return read_preference(os.getenv("MONGO_ANALYTICS_READ_PREFERENCE", "secondaryPreferred"))
+
+
+def client_options() -> Dict[str, Any]:
+    options = {
+        "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE", 50),
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 0),
+        "maxIdleTimeMS": _env_int("MONGO_MAX_IDLE_TIME_MS", 300000),
+        "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS", 5000),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        "socketTimeoutMS": _env_int("MONGO_SOCKET_TIMEOUT_MS", None),
+        "waitQueueTimeoutMS": _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", None),
+        "readPreference": os.getenv("MONGO_READ_PREFERENCE", "primary"),
+        "appname": os.getenv("MONGO_APP_NAME", "mongo-rag"),
+    }
+    read_preference(options["readPreference"])  # validate early
+    return {key: value for key, value in options.items() if value is not None}
+
+
+def _resolve_uri(uri: Optional[str]) -> str:
+    uri = uri or os.getenv("MONGODB_URI")
+    if not uri:
+        raise ValueError("MONGODB_URI is not set")
+    return uri
+
+
+def get_client(uri: Optional[str] = None) -> MongoClient:
+    """The shared MongoClient for `uri` (default MONGODB_URI), created on first use."""
+    uri = _resolve_uri(uri)
+    client = _clients.get(uri)
+    if client is None:
+        with _lock:
+            client = _clients.get(uri)
+            if client is None:
+                client = MongoClient(uri, **client_options())
+                _clients[uri] = client
+    return client
+
+
+def get_async_client(uri: Optional[str] = None):
+    """The shared AsyncMongoClient for `uri`; use it from a single event loop."""
+    uri = _resolve_uri(uri)
+    client = _async_clients.get(uri)
+    if client is None:
+        with _lock:
+            client = _async_clients.get(uri)
+            if client is None:
+                from pymongo import AsyncMongoClient
+
+                client = AsyncMongoClient(uri, **client_options())
+                _async_clients[uri] = client
+    return client
+
+
+def get_database(name: str, uri: Optional[str] = None, read_preference_name: Optional[str] = None) -> Database:
+    return get_client(uri).get_database(name, read_preference=read_preference(read_preference_name))
+
+
+def close_clients() -> None:
+    """Close the shared sync clients, e.g. at process shutdown."""
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+async def aclose_clients() -> None:
+    """Close the shared async clients; await it on the event loop that used them."""
+    with _lock:
+        clients = list(_async_clients.values())
+        _async_clients.clear()
+    for client in clients:
+        await client.close()
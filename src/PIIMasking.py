@@ -1,15 +1,31 @@
-from presidio_analyzer import AnalyzerEngine
-from presidio_anonymizer import AnonymizerEngine
-import uuid
 import re
+from typing import Any, Dict, List, Optional, Tuple
 
-from presidio_analyzer import AnalyzerEngine
-import re
+from presidio_analyzer import BatchAnalyzerEngine
+
+from ModelRegistry import get_presidio_analyzer
+
+# Entity types analyzed in structured mode; only the matching recognizers run
+DEFAULT_ENTITIES = [
+    "PERSON",
+    "EMAIL_ADDRESS",
+    "PHONE_NUMBER",
+    "LOCATION",
+    "CREDIT_CARD",
+    "IBAN_CODE",
+    "IP_ADDRESS",
+    "US_SSN",
+]
 
 class PIIMasker:
-    def __init__(self):
-        self.analyzer = AnalyzerEngine()
+    def __init__(self, model=None, entities: Optional[List[str]] = None, batch_size: int = 64):
+        # Shared analyzer, loaded once per process by ModelRegistry
+        self.analyzer = get_presidio_analyzer(model)
+        self.batch_analyzer = BatchAnalyzerEngine(analyzer_engine=self.analyzer)
+        self.entities = list(entities or DEFAULT_ENTITIES)
+        self.batch_size = batch_size
         self.mapping = {}
+        self.counter = {}
 
     def mask(self, text):
         results = self.analyzer.analyze(text=text, entities=None, language='en')
@@ -48,11 +64,89 @@ class PIIMasker:
             text = text.replace(placeholder, original)
         return text
 
+    def reset(self) -> None:
+        self.mapping = {}
+        self.counter = {}
+
+    def mask_structured(self, data: Any, reset: bool = True) -> Tuple[Any, Dict[str, str]]:
+        """Mask every string value in the dicts/lists returned by the toolkit.
+
+        All distinct string values are analyzed in one BatchAnalyzerEngine
+        run, restricted to `self.entities`; repeated values are analyzed once.
+        `data` is modified in place and returned with the mapping.
+        """
+        if reset:
+            self.reset()
+        if isinstance(data, str):
+            masked, _ = self.mask_structured([data], reset=False)
+            return masked[0], self.mapping
+
+        leaves: List[Tuple[Any, Any, str]] = []
+        self._collect_string_leaves(data, leaves)
+        unique_texts = list(dict.fromkeys(text for _, _, text in leaves))
+        results = self.batch_analyzer.analyze_iterator(
+            texts=unique_texts,
+            language="en",
+            entities=self.entities,
+            batch_size=self.batch_size,
+        )
+        results_by_text = dict(zip(unique_texts, results))
+
+        for parent, key, text in leaves:
+            parent[key] = self._replace_results(text, results_by_text.get(text) or [])
+        return data, self.mapping
+
+    def unmask_structured(self, data: Any) -> Any:
+        if isinstance(data, dict):
+            return {k: self.unmask_structured(v) for k, v in data.items()}
+        elif isinstance(data, list):
+            return [self.unmask_structured(item) for item in data]
+        elif isinstance(data, str):
+            return self.unmask(data)
+        return data
+
+    def _collect_string_leaves(self, obj, leaves: List[Tuple[Any, Any, str]]) -> None:
+        if isinstance(obj, dict):
+            items = obj.items()
+        elif isinstance(obj, list):
+            items = enumerate(obj)
+        else:
+            return
+        for key, value in items:
+            if isinstance(value, str):
+                leaves.append((obj, key, value))
+            else:
+                self._collect_string_leaves(value, leaves)
+
+    def _replace_results(self, text: str, results) -> str:
+        """Swap analyzer results for placeholders, building the string once."""
+        if not results:
+            return text
+        # Highest score (then longest span) wins where results overlap
+        chosen = []
+        for res in sorted(results, key=lambda r: (-r.score, r.start - r.end)):
+            if all(res.end <= start or res.start >= end for start, end, _ in chosen):
+                chosen.append((res.start, res.end, res.entity_type))
+
+        parts = []
+        position = 0
+        for start, end, entity in sorted(chosen):
+            idx = self.counter.get(entity, 0)
+            placeholder = f"<{entity}_{idx}>"
+            self.counter[entity] = idx + 1
+            self.mapping[placeholder] = text[start:end]
+            parts.append(text[position:start])
+            parts.append(placeholder)
+            position = end
+        parts.append(text[position:])
+        return "".join(parts)
+
 
 
-masker = PIIMasker()
-text = "My name is John Doe and my email is 1w2M1@example.com"
-masked = masker.mask(text)
-print("Masked:", masked)
-unmasked = masker.unmask(masked)
-print("Unmasked:", unmasked)
\ No newline at end of file
+if __name__ == "__main__":
+    masker = PIIMasker()
+    text = "My name is John Doe and my email is 1w2M1@example.com"
+    masked = masker.mask(text)
+    print("Masked:", masked)
+    unmasked = masker.unmask(masked)
+    print("Unmasked:", unmasked)
@@ -0,0 +1,265 @@
+"""
+Pre-flight cost check for LLM-generated aggregation pipelines.
+
+Before a pipeline runs, QueryCostGuard
+- looks for patterns that defeat indexes: an unanchored or case-insensitive
+  `$regex`, and `$unwind`/`$lookup`/`$group` before the first `$match`;
+- runs `explain` (queryPlanner verbosity by default, which does not execute
+  the query) and walks the winning plan for COLLSCAN;
+- estimates the documents the query examines: the collection's estimated
+  count for a collection scan, `totalDocsExamined` when explaining with
+  "executionStats";
+- adds the `$lookup` / `$graphLookup` fan-out: none of the hr collections
+  has an index on its join fields, so every document reaching the join
+  scans the whole foreign collection (outer documents x foreign count). The
+  outer documents are counted with the leading `$match` and capped by a
+  `$limit` before the first join.
+
+A pipeline over `max_docs_examined` raises PipelineRejected whose message is
+a JSON hint the agent can act on (reason, estimate, budget, issues and
+suggested rewrites). So does a collection scan with an unanchored regex or
+a `$unwind`/`$lookup` before the first `$match` (`reject_issues_on_collscan`).
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo.collection import Collection
+
+# Stages that make every later $match run on the whole collection
+SCAN_FORCING_STAGES = ("$unwind", "$lookup", "$graphLookup", "$group", "$facet")
+# Of those, the ones that multiply the work done before the filter
+COSTLY_STAGES = ("$unwind", "$lookup", "$graphLookup")
+JOIN_STAGES = ("$lookup", "$graphLookup")
+
+
+class PipelineRejected(ValueError):
+    """Raised when a pipeline is estimated to exceed the cost budget."""
+
+    def __init__(self, hint: Dict[str, Any]):
+        self.hint = hint
+        super().__init__(json.dumps(hint, default=str))
+
+
+def _is_unanchored(pattern: Any, options: str = "") -> bool:
+    if hasattr(pattern, "pattern"):  # compiled re / bson Regex
+        options = options + ("i" if getattr(pattern, "flags", 0) & 2 else "")
+        pattern = pattern.pattern
+    if not isinstance(pattern, str):
+        return False
+    return not pattern.startswith("^") or "i" in options
+
+
+def find_regex_issues(value: Any, path: str = "") -> List[str]:
+    """Unanchored or case-insensitive regexes anywhere in a $match filter."""
+    issues = []
+    if isinstance(value, dict):
+        if "$regex" in value:
+            if _is_unanchored(value["$regex"], str(value.get("$options", ""))):
+                issues.append(
+                    f"$regex on '{path or '?'}' is unanchored or case-insensitive and cannot use an index range"
+                )
+            return issues
+        for key, sub in value.items():
+            sub_path = path if key.startswith("$") else (f"{path}.{key}" if path else key)
+            issues.extend(find_regex_issues(sub, sub_path))
+    elif isinstance(value, list):
+        for item in value:
+            issues.extend(find_regex_issues(item, path))
+    elif hasattr(value, "pattern") and _is_unanchored(value):
+        issues.append(f"regex on '{path or '?'}' is unanchored or case-insensitive and cannot use an index range")
+    return issues
+
+
+def static_issues(agg_pipeline: List[Dict[str, Any]], stages=SCAN_FORCING_STAGES) -> List[str]:
+    issues = []
+    seen_match = False
+    for index, stage in enumerate(agg_pipeline):
+        for name, spec in stage.items():
+            if name == "$match":
+                issues.extend(find_regex_issues(spec))
+                seen_match = True
+            elif not seen_match and name in stages:
+                issues.append(
+                    f"stage {index} ({name}) runs before the first $match, so the filter cannot use an index"
+                )
+    return issues
+
+
+def join_plan(agg_pipeline: List[Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], Optional[int], List[str]]:
+    """What the join fan-out estimate needs: the filter of the leading $match
+    stages, the smallest $limit before the first join and the collection
+    each top-level $lookup / $graphLookup scans."""
+    filters: List[Dict[str, Any]] = []
+    limit: Optional[int] = None
+    foreign: List[str] = []
+    leading = True
+    for stage in agg_pipeline:
+        for name, spec in stage.items():
+            if name in JOIN_STAGES:
+                if isinstance(spec, dict) and isinstance(spec.get("from"), str):
+                    foreign.append(spec["from"])
+                leading = False
+            elif foreign:
+                continue
+            elif name == "$match" and leading and isinstance(spec, dict):
+                filters.append(spec)
+            else:
+                leading = False
+                if name == "$limit" and isinstance(spec, int):
+                    limit = spec if limit is None else min(limit, spec)
+    if not filters:
+        return None, limit, foreign
+    return (filters[0] if len(filters) == 1 else {"$and": filters}), limit, foreign
+
+
+def winning_plans(explain: Any) -> List[Dict[str, Any]]:
+    """Every `winningPlan` in an explain document (per shard / per $cursor stage)."""
+    plans = []
+    if isinstance(explain, dict):
+        for key, value in explain.items():
+            if key == "winningPlan" and isinstance(value, dict):
+                plans.append(value)
+            else:
+                plans.extend(winning_plans(value))
+    elif isinstance(explain, list):
+        for item in explain:
+            plans.extend(winning_plans(item))
+    return plans
+
+
+def plan_stages(plan: Any) -> List[str]:
+    stages = []
+    if isinstance(plan, dict):
+        if isinstance(plan.get("stage"), str):
+            stages.append(plan["stage"])
+        for value in plan.values():
+            if isinstance(value, (dict, list)):
+                stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(plan_stages(item))
+    return stages
+
+
+def _find_number(explain: Any, key: str) -> Optional[int]:
+    if isinstance(explain, dict):
+        if isinstance(explain.get(key), (int, float)):
+            return int(explain[key])
+        values = [_find_number(v, key) for v in explain.values()]
+    elif isinstance(explain, list):
+        values = [_find_number(v, key) for v in explain]
+    else:
+        return None
+    values = [v for v in values if v is not None]
+    return sum(values) if values else None
+
+
+class QueryCostGuard:
+    """Explain-based budget check, see module docstring."""
+
+    def __init__(
+        self,
+        max_docs_examined: int = 100000,
+        verbosity: str = "queryPlanner",
+        reject_collscan: bool = False,
+        reject_issues_on_collscan: bool = True,
+    ):
+        self.max_docs_examined = max_docs_examined
+        self.verbosity = verbosity
+        # Reject any collection scan, whatever the collection size
+        self.reject_collscan = reject_collscan
+        # Reject a collection scan that also has an unanchored regex or a
+        # $unwind / $lookup before the first $match
+        self.reject_issues_on_collscan = reject_issues_on_collscan
+
+    def _explain_args(self, collection, agg_pipeline: List[Dict[str, Any]]):
+        # Explain on the members the query will run on (analytics read preference)
+        return (
+            ("explain", {"aggregate": collection.name, "pipeline": agg_pipeline, "cursor": {}}),
+            {"verbosity": self.verbosity, "read_preference": collection.read_preference},
+        )
+
+    def _foreign(self, collection, name: str):
+        return collection.database.get_collection(name, read_preference=collection.read_preference)
+
+    def explain(self, collection: Collection, agg_pipeline: List[Dict[str, Any]]) -> Dict[str, Any]:
+        args, kwargs = self._explain_args(collection, agg_pipeline)
+        return collection.database.command(*args, **kwargs)
+
+    def check(self, collection: Collection, agg_pipeline: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Return the cost report, or raise PipelineRejected if over budget."""
+        explain = self.explain(collection, agg_pipeline)
+        stages = [stage for plan in winning_plans(explain) for stage in plan_stages(plan)]
+        estimate = _find_number(explain, "totalDocsExamined")
+        if estimate is None and "COLLSCAN" in stages:
+            estimate = collection.estimated_document_count()
+
+        leading_filter, limit, foreign = join_plan(agg_pipeline)
+        if foreign:
+            if leading_filter is None:
+                outer = collection.estimated_document_count()
+            else:
+                outer = collection.count_documents(leading_filter)
+            if limit is not None:
+                outer = min(outer, limit)
+            scans = sum(self._foreign(collection, name).estimated_document_count() for name in foreign)
+            estimate = (estimate or 0) + outer * scans
+        return self._judge(collection.name, agg_pipeline, stages, estimate)
+
+    async def acheck(self, collection, agg_pipeline: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """`check` for a pymongo AsyncCollection."""
+        args, kwargs = self._explain_args(collection, agg_pipeline)
+        explain = await collection.database.command(*args, **kwargs)
+        stages = [stage for plan in winning_plans(explain) for stage in plan_stages(plan)]
+        estimate = _find_number(explain, "totalDocsExamined")
+        if estimate is None and "COLLSCAN" in stages:
+            estimate = await collection.estimated_document_count()
+
+        leading_filter, limit, foreign = join_plan(agg_pipeline)
+        if foreign:
+            if leading_filter is None:
+                outer = await collection.estimated_document_count()
+            else:
+                outer = await collection.count_documents(leading_filter)
+            if limit is not None:
+                outer = min(outer, limit)
+            scans = 0
+            for name in foreign:
+                scans += await self._foreign(collection, name).estimated_document_count()
+            estimate = (estimate or 0) + outer * scans
+        return self._judge(collection.name, agg_pipeline, stages, estimate)
+
+    def _judge(
+        self,
+        collection_name: str,
+        agg_pipeline: List[Dict[str, Any]],
+        stages: List[str],
+        estimate: Optional[int],
+    ) -> Dict[str, Any]:
+        collscan = "COLLSCAN" in stages
+        report = {
+            "collection": collection_name,
+            "plan": "COLLSCAN" if collscan else ("IXSCAN" if "IXSCAN" in stages else None),
+            "estimated_docs_examined": estimate,
+            "budget": self.max_docs_examined,
+            "issues": static_issues(agg_pipeline),
+        }
+        over_budget = estimate is not None and estimate > self.max_docs_examined
+        blocking = static_issues(agg_pipeline, COSTLY_STAGES) if collscan and self.reject_issues_on_collscan else []
+        if over_budget or blocking or (collscan and self.reject_collscan):
+            report["error"] = "pipeline_rejected"
+            if over_budget:
+                report["reason"] = f"estimated {estimate} documents examined, budget is {self.max_docs_examined}"
+            elif blocking:
+                report["reason"] = "collection scan with: " + "; ".join(blocking)
+            else:
+                report["reason"] = "collection scans are not allowed"
+            report["suggestions"] = [
+                "Put a selective $match on indexed fields first in the pipeline.",
+                "Anchor regexes with ^ and avoid the 'i' option, or match exact values.",
+                "Move $unwind/$lookup/$group after the $match that narrows the documents.",
+                "Narrow the documents (with $match or $limit) before $lookup: each one scans the whole foreign collection.",
+            ]
+            raise PipelineRejected(report)
+        return report
@@ -0,0 +1,223 @@
+"""
+Prebuilt pipelines for the most frequent question patterns.
+
+Most traffic is a handful of shapes (see the NATURAL_LANGUAGE_QUERY examples
+in Mongo.py): leave balance for an employee code, joiners in a year,
+leavers in a year with their emails, the SAP id status of an employee.
+Each QueryTemplate below has a cheap regex matcher, slot extraction and a
+prebuilt pipeline; `match_template(question)` returns the command for
+`MongoDBDatabasePIIToolkit.run`, so these questions skip the agent loop.
+
+The matchers are deliberately narrow: a question that adds a qualifier
+the template cannot express (a department, a region, a grade...) does not
+match and goes to the agent as before.
+
+Column names come from ReportFields. `usable_templates(toolkit)` is run
+once at startup and drops (loudly) every template whose fields are missing
+from its collection, instead of letting it return no rows on every call.
+"""
+
+import json
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Pattern, Tuple
+
+from ReportFields import (
+    ABSENCE_NAME,
+    BASE_REPORT,
+    DATE_OF_JOINING,
+    DATE_OF_RESIGNATION,
+    EMPLOYEE_CODE,
+    FIRST_NAME,
+    LAST_NAME,
+    LEAVE_BALANCE,
+    LEAVE_START_DATE,
+    LEAVE_TRANSACTION,
+    OFFBOARDING,
+    OFFBOARDING_EMPLOYEE_ID,
+    OFFBOARDING_EMPLOYEE_NAME,
+    PRIMARY_EMAIL,
+    SAP_COLUMNS,
+    as_date,
+    missing_fields,
+)
+
+EMPLOYEE_ID = re.compile(r"\b(?:emp(?:loyee)?|person)\.?\s*(?:id|code|no\.?|number)?\s*[:#]?\s*(\d+)\b", re.I)
+YEAR = re.compile(r"\b((?:19|20)\d{2})\b|\b(this|current|last|previous)\s+year\b", re.I)
+HOW_MANY = re.compile(r"\b(how\s+many|number\s+of|count|total)\b", re.I)
+# Parsed resignation date, set inside the leavers pipeline
+RESIGNED_ON = "resigned on"
+# Qualifiers none of the templates below can express
+QUALIFIERS = re.compile(
+    r"\b(department|dept|region|location|office|grade|designation|manager|male|female|active|voluntar\w*|involuntar\w*|"
+    r"north|south|east|west|corporate)\b",
+    re.I,
+)
+
+
+def _year(question: str) -> Optional[int]:
+    match = YEAR.search(question)
+    if match is None:
+        return None
+    if match.group(1):
+        return int(match.group(1))
+    this_year = date.today().year
+    return this_year if match.group(2).lower() in ("this", "current") else this_year - 1
+
+
+def _year_range(field: str, year: int) -> Dict[str, Any]:
+    return {field: {
+        "$gte": datetime(year, 1, 1, tzinfo=timezone.utc),
+        "$lt": datetime(year + 1, 1, 1, tzinfo=timezone.utc),
+    }}
+
+
+def _literal(value: Any) -> str:
+    # `run` evaluates the pipeline as Python after rewriting ISODate/ObjectId,
+    # so booleans and null are written True/False/None
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{json.dumps(str(k))}: {_literal(v)}" for k, v in value.items()) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(_literal(v) for v in value) + "]"
+    if isinstance(value, datetime):
+        return f'ISODate("{value.isoformat()}")'
+    if isinstance(value, str):
+        return json.dumps(value)
+    if value is None or isinstance(value, (bool, int, float)):
+        return repr(value)
+    if type(value).__name__ == "ObjectId":
+        return f'ObjectId("{value}")'
+    raise TypeError(f"{type(value).__name__} values cannot be written in a command")
+
+
+def render_command(collection: str, pipeline: List[Dict[str, Any]]) -> str:
+    """A `db.<collection>.aggregate([...])` command in the syntax `run` parses."""
+    return f"db.{collection}.aggregate({_literal(pipeline)})"
+
+
+@dataclass(frozen=True)
+class QueryTemplate:
+    name: str
+    collection: str
+    intent: Pattern
+    slots: Callable[[str], Optional[Dict[str, Any]]]
+    pipeline: Callable[..., List[Dict[str, Any]]]
+    title: str
+    # Fields the pipeline reads, checked by usable_templates
+    fields: Tuple[str, ...]
+    exclude: Optional[Pattern] = None
+
+    def match(self, question: str) -> Optional[Tuple[str, str]]:
+        """(command, title) for `question`, or None if it does not fit."""
+        if not self.intent.search(question):
+            return None
+        if self.exclude is not None and self.exclude.search(question):
+            return None
+        slots = self.slots(question)
+        if slots is None:
+            return None
+        return render_command(self.collection, self.pipeline(**slots)), self.title.format(**slots)
+
+
+def _employee_slots(question: str) -> Optional[Dict[str, Any]]:
+    match = EMPLOYEE_ID.search(question)
+    return {"employee": int(match.group(1))} if match else None
+
+
+def _count_year_slots(question: str) -> Optional[Dict[str, Any]]:
+    year = _year(question)
+    return {"year": year} if year is not None and HOW_MANY.search(question) else None
+
+
+def _year_slots(question: str) -> Optional[Dict[str, Any]]:
+    year = _year(question)
+    return {"year": year} if year is not None else None
+
+
+TEMPLATES = [
+    QueryTemplate(
+        name="leave_balance",
+        collection=LEAVE_TRANSACTION,
+        intent=re.compile(r"\b(balance|remaining)\s+leaves?\b|\bleaves?\s+(balance|remaining|left)\b", re.I),
+        slots=_employee_slots,
+        pipeline=lambda employee: [
+            {"$match": {EMPLOYEE_CODE: employee}},
+            {"$sort": {LEAVE_START_DATE: -1}},
+            {"$group": {"_id": f"${ABSENCE_NAME}", "balance": {"$first": f"${LEAVE_BALANCE}"}}},
+            {"$project": {"_id": 0, "leave type": "$_id", "balance": 1}},
+            {"$sort": {"leave type": 1}},
+        ],
+        title="Leave balance for employee {employee} (latest transaction per leave type):",
+        fields=(EMPLOYEE_CODE, LEAVE_START_DATE, ABSENCE_NAME, LEAVE_BALANCE),
+    ),
+    QueryTemplate(
+        name="joiners_in_year",
+        collection=BASE_REPORT,
+        intent=re.compile(r"\b(joined|joiners?|joinees?|hired)\b", re.I),
+        exclude=re.compile(QUALIFIERS.pattern + r"|\b(resign\w*|left|leav\w*|exit\w*)\b", re.I),
+        slots=_count_year_slots,
+        pipeline=lambda year: [
+            {"$match": _year_range(DATE_OF_JOINING, year)},
+            {"$count": "joiners"},
+        ],
+        title="Employees who joined in {year}:",
+        fields=(DATE_OF_JOINING,),
+    ),
+    QueryTemplate(
+        name="leavers_in_year_with_emails",
+        collection=BASE_REPORT,
+        intent=re.compile(r"\b(left|leavers?|resigned|exited)\b.*\be-?mails?\b|\be-?mails?\b.*\b(left|leavers?|resigned|exited)\b", re.I),
+        exclude=re.compile(QUALIFIERS.pattern + r"|\b(joined|joiners?)\b", re.I),
+        slots=_year_slots,
+        pipeline=lambda year: [
+            # dor is stored as a dd-mm-yyyy string
+            {"$set": {RESIGNED_ON: as_date(DATE_OF_RESIGNATION)}},
+            {"$match": _year_range(RESIGNED_ON, year)},
+            {"$sort": {RESIGNED_ON: 1}},
+            {"$project": {
+                "_id": 0, EMPLOYEE_CODE: 1, FIRST_NAME: 1, LAST_NAME: 1, PRIMARY_EMAIL: 1, DATE_OF_RESIGNATION: 1,
+            }},
+        ],
+        title="Employees who left in {year}, with their emails:",
+        fields=(DATE_OF_RESIGNATION, EMPLOYEE_CODE, FIRST_NAME, LAST_NAME, PRIMARY_EMAIL),
+    ),
+    QueryTemplate(
+        name="sap_status",
+        collection=OFFBOARDING,
+        intent=re.compile(r"\bsap\b", re.I),
+        slots=_employee_slots,
+        pipeline=lambda employee: [
+            {"$match": {OFFBOARDING_EMPLOYEE_ID: employee}},
+            {"$project": {"_id": 0, OFFBOARDING_EMPLOYEE_ID: 1, OFFBOARDING_EMPLOYEE_NAME: 1, **{c: 1 for c in SAP_COLUMNS}}},
+        ],
+        title="SAP id status for employee {employee}:",
+        fields=(OFFBOARDING_EMPLOYEE_ID, OFFBOARDING_EMPLOYEE_NAME, *SAP_COLUMNS),
+    ),
+]
+TEMPLATES_BY_NAME = {template.name: template for template in TEMPLATES}
+
+
+def usable_templates(toolkit, templates: Optional[List[QueryTemplate]] = None) -> List[QueryTemplate]:
+    """The templates whose fields all exist in a sample document of their
+    collection (through `toolkit`, so shadow mode checks the shadow copies)."""
+    usable = []
+    for template in TEMPLATES if templates is None else templates:
+        missing = missing_fields(toolkit._physical_collection(template.collection), template.fields)
+        if missing:
+            print(f"[E] QueryTemplates: {template.name} disabled, {template.collection} has no field(s) {missing}")
+            continue
+        usable.append(template)
+    return usable
+
+
+def match_template(
+    question: str, templates: Optional[List[QueryTemplate]] = None
+) -> Optional[Tuple[QueryTemplate, str, str]]:
+    """The first of `templates` (default: all) matching `question`, with its
+    command and answer title."""
+    for template in TEMPLATES if templates is None else templates:
+        matched = template.match(question)
+        if matched is not None:
+            return (template,) + matched
+    return None
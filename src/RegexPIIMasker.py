@@ -1,5 +1,5 @@
 import re
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, Optional, Tuple
 
 import re
 from typing import Any, Dict, Tuple
@@ -31,6 +31,9 @@ PII_FIELDS = [
     "manager email",
 ]
 
+# Shape of the tokens produced by _get_mask_token, e.g. "[First Name 0]"
+TOKEN_PATTERN = re.compile(r"\[[^\[\]]+ \d+\]")
+
 class FieldBasedPIIMasker:
     def __init__(self, custom_pii_fields=None):
         self.mapping: Dict[str, str] = {}
@@ -42,15 +45,28 @@ class FieldBasedPIIMasker:
             r"|".join(rf"\b{kw}\b" for kw in PII_KEYWORDS), re.IGNORECASE
         )
 
-    def mask(self, data: Any) -> Tuple[Any, Dict[str, str]]:
-        """Mask PII in JSON-like dict or list."""
-        self.mapping = {}
-        self.counter = {}
+    def mask(self, data: Any, reset: bool = True, collection: Optional[str] = None) -> Tuple[Any, Dict[str, str]]:
+        """Mask PII in JSON-like dict or list.
+
+        Pass ``reset=False`` to keep extending the current mapping, e.g. when
+        documents are masked one at a time while streaming a cursor.
+        ``collection`` is the source collection; key rules here do not depend
+        on it (see TieredPIIMasker).
+        """
+        if reset:
+            self.reset()
         masked = self._mask_recursive(data)
         return masked, self.mapping
 
+    def reset(self) -> None:
+        """Forget all tokens handed out so far."""
+        self.mapping = {}
+        self.counter = {}
+
     def unmask(self, data: Any) -> Any:
         """Restore original values from masked text or JSON."""
+        if not self.mapping:
+            return data
         return self._unmask_recursive(data)
 
     def _mask_recursive(self, obj: Any) -> Any:
@@ -97,9 +113,9 @@ class FieldBasedPIIMasker:
         elif isinstance(obj, list):
             return [self._unmask_recursive(item) for item in obj]
         elif isinstance(obj, str):
-            for token, original in self.mapping.items():
-                obj = re.sub(re.escape(token), original, obj)
-            return obj
+            # Scan once for anything shaped like a token and look it up,
+            # instead of one substitution pass per mapping entry
+            return TOKEN_PATTERN.sub(lambda m: self.mapping.get(m.group(), m.group()), obj)
         else:
             return obj
 
@@ -0,0 +1,87 @@
+"""
+Report columns as they are stored in the `hr` collections.
+
+The names come from the spreadsheets in Dataset/System Reports, passed
+through xls_to_json's `prettify_key` (lower case, "_", "-" and punctuation
+turned into spaces):
+
+- base_report: "1.DatabaseReport_Rpt_Data base Report.xls", one header row.
+  DOJ is a date column for xls_to_json; DOR and DOL are not and stay
+  "dd-mm-yyyy" strings, so read them through `as_date`.
+- offboarding: "2. Offboarding/Output1.xls" has two header rows, so every
+  column is nested under its group ("Core HR", "Status", "Exit Checklist -
+  IT", ...): `core hr.employee id`, `status.all task status`, ...
+- leave_transaction: "8.Leave Transaction With Balance Report ... .xlsx",
+  one header row (see Outputs/xls_to_json).
+
+Rollups and query templates check their fields with `missing_fields`
+before relying on them, so a renamed column fails loudly instead of
+producing empty results.
+"""
+
+from typing import Any, Dict, Iterable, List
+
+BASE_REPORT = "base_report"
+OFFBOARDING = "offboarding"
+LEAVE_TRANSACTION = "leave_transaction"
+
+# base_report
+EMPLOYEE_CODE = "employee code"
+FIRST_NAME = "first name"
+LAST_NAME = "last name"
+DEPARTMENT = "department"
+REGION = "region"
+PRIMARY_EMAIL = "primary email"
+DATE_OF_JOINING = "doj"
+DATE_OF_RESIGNATION = "dor"
+DATE_OF_LEAVING = "dol"
+ASSIGNMENT_STATUS = "assignment status type"
+ACTIVE = "ACTIVE"
+REPORT_DATE_FORMAT = "%d-%m-%Y"
+
+# offboarding, nested under the report's header groups
+OFFBOARDING_EMPLOYEE_ID = "core hr.employee id"
+OFFBOARDING_EMPLOYEE_NAME = "core hr.employee name"
+OFFBOARDING_DEPARTMENT = "core hr.department"
+OFFBOARDING_REGION = "core hr.region"
+OFFBOARDING_STATUS = "status.all task status"
+OFFBOARDING_DONE = ["Completed", "Closed"]
+SAP_COLUMNS = [
+    "exit checklist it.crm sso prm kenan vms evd victory bo sap ids disabled",
+    "exit checklist it.account ids login id email id siebel sap ess password disabled",
+]
+
+# leave_transaction
+ABSENCE_NAME = "absence name"
+LEAVE_START_DATE = "start date"
+LEAVE_BALANCE = "balance val"
+
+
+def as_date(field: str) -> Dict[str, Any]:
+    """Expression for `field` as a date, whether it is stored as a date or
+    as a "dd-mm-yyyy" string. Other values are returned unchanged, so they
+    never match a date range or {"$type": "date"}."""
+    path = f"${field}"
+    return {"$cond": [
+        {"$eq": [{"$type": path}, "string"]},
+        {"$dateFromString": {"dateString": path, "format": REPORT_DATE_FORMAT, "onError": path}},
+        path,
+    ]}
+
+
+def _has_path(doc: Dict[str, Any], path: str) -> bool:
+    value: Any = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return False
+        value = value[part]
+    return True
+
+
+def missing_fields(collection, fields: Iterable[str]) -> List[str]:
+    """The dotted `fields` absent from a sample document of `collection`
+    (a pymongo Collection); all of them when it is empty."""
+    sample = collection.find_one()
+    if sample is None:
+        return list(fields)
+    return [field for field in fields if not _has_path(sample, field)]
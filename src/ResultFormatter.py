@@ -0,0 +1,115 @@
+"""
+Token-efficient serialization of query results for the LLM.
+
+`bson.json_util.dumps(..., indent=2)` repeats every key on every row and
+wraps dates and ids in `$date`/`$oid` objects. The formats here drop that
+overhead:
+
+- "json":     the original indented Extended JSON (kept for compatibility)
+- "compact":  one-line JSON with relaxed values
+- "columnar": {"columns": [...], "rows": [[...], ...]} as one-line JSON
+- "table":    a pipe-separated header line followed by one line per row
+
+Relaxed values: datetimes become ISO strings (just the date at midnight),
+ObjectId/Decimal128 become strings, and an ObjectId `_id` is dropped
+unless asked for, since it carries no meaning for the answer.
+"""
+
+import json
+from datetime import datetime
+from typing import Any, Dict, List
+
+from bson.json_util import dumps
+
+OUTPUT_FORMATS = ("json", "compact", "columnar", "table")
+
+try:
+    import tiktoken
+
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken is optional; fall back to an estimate
+    _ENCODING = None
+
+
+def count_tokens(text: str) -> int:
+    """Prompt tokens for `text` (tiktoken when installed, else ~4 chars/token)."""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return (len(text) + 3) // 4
+
+
+def to_plain(value: Any) -> Any:
+    """Convert BSON types to plain JSON values."""
+    if isinstance(value, dict):
+        return {k: to_plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_plain(v) for v in value]
+    if isinstance(value, datetime):
+        if (value.hour, value.minute, value.second, value.microsecond) == (0, 0, 0, 0):
+            return value.date().isoformat()
+        return value.isoformat()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    # ObjectId, Decimal128, UUID, ...
+    return str(value)
+
+
+def _prepare(doc: Dict[str, Any], keep_object_id: bool) -> Dict[str, Any]:
+    if not keep_object_id and "_id" in doc and type(doc["_id"]).__name__ == "ObjectId":
+        doc = {k: v for k, v in doc.items() if k != "_id"}
+    return to_plain(doc)
+
+
+def format_document(doc: Dict[str, Any], output_format: str = "compact", keep_object_id: bool = False) -> str:
+    """Serialize one document for the streaming path ("json" or "compact")."""
+    if output_format == "json":
+        return dumps(doc, separators=(",", ":"))
+    return json.dumps(_prepare(doc, keep_object_id), separators=(",", ":"), ensure_ascii=False)
+
+
+def format_results(
+    docs: List[Dict[str, Any]],
+    output_format: str = "json",
+    keep_object_id: bool = False,
+) -> str:
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format {output_format!r}; expected one of {OUTPUT_FORMATS}")
+    if output_format == "json":
+        return dumps(docs, indent=2)
+
+    rows = [_prepare(doc, keep_object_id) if isinstance(doc, dict) else to_plain(doc) for doc in docs]
+    if output_format == "compact":
+        return json.dumps(rows, separators=(",", ":"), ensure_ascii=False)
+
+    columns: List[str] = []
+    seen = set()
+    for row in rows:
+        for key in row:
+            if key not in seen:
+                seen.add(key)
+                columns.append(key)
+
+    if output_format == "columnar":
+        return json.dumps(
+            {"columns": columns, "rows": [[row.get(c) for c in columns] for row in rows]},
+            separators=(",", ":"),
+            ensure_ascii=False,
+        )
+
+    lines = [" | ".join(columns)]
+    for row in rows:
+        lines.append(" | ".join(_table_cell(row.get(c)) for c in columns))
+    return "\n".join(lines)
+
+
+def _table_cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+    return str(value).replace("|", "/").replace("\n", " ")
+
+
+def format_token_counts(docs: List[Dict[str, Any]], keep_object_id: bool = False) -> Dict[str, int]:
+    """Prompt tokens of `docs` in every format, to measure the saving."""
+    return {fmt: count_tokens(format_results(docs, fmt, keep_object_id)) for fmt in OUTPUT_FORMATS}
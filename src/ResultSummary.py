@@ -0,0 +1,160 @@
+"""
+Summaries of oversized aggregation results, and a server-side store for
+the full result sets.
+
+When a result is too large to hand to the LLM, the toolkit returns
+`summarize(docs)` instead: the row count, per-field statistics and the
+first rows. Every value in the summary stays keyed by its field name, e.g.
+
+    "top_values": [{"region": "West", "count": 812}, ...],
+    "min": {"date of joining": ...}, "max": {"date of joining": ...}
+
+so the key-based maskers (FieldBasedPIIMasker, TieredPIIMasker) mask the
+summary exactly as they would mask the rows. The full, unmasked result is
+kept in a ResultStore under a short handle, for export outside the LLM.
+"""
+
+import json
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson.json_util import dumps
+
+from ResultFormatter import to_plain
+
+
+def _type_name(value: Any) -> str:
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, datetime):
+        return "date"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, (dict, list)):
+        return "object" if isinstance(value, dict) else "array"
+    return type(value).__name__
+
+
+def _hashable(value: Any) -> Any:
+    return dumps(value, sort_keys=True) if isinstance(value, (dict, list)) else value
+
+
+def summarize(docs: List[Dict[str, Any]], sample_rows: int = 10, top_values: int = 5) -> Dict[str, Any]:
+    """Count, per-field type / distinct / top values / min / max, and the first rows."""
+    fields: Dict[str, Dict[str, Any]] = OrderedDict()
+    for doc in docs:
+        for key, value in doc.items():
+            stats = fields.get(key)
+            if stats is None:
+                stats = fields[key] = {"types": Counter(), "values": Counter(), "originals": {}, "min": None, "max": None}
+            stats["types"][_type_name(value)] += 1
+            if value is None or value == "":
+                continue
+            marker = _hashable(value)
+            stats["values"][marker] += 1
+            stats["originals"].setdefault(marker, value)
+            if isinstance(value, (int, float, datetime)) and not isinstance(value, bool):
+                try:
+                    if stats["min"] is None or value < stats["min"]:
+                        stats["min"] = value
+                    if stats["max"] is None or value > stats["max"]:
+                        stats["max"] = value
+                except TypeError:  # numbers and dates mixed in one field
+                    pass
+
+    field_summaries = {}
+    for key, stats in fields.items():
+        summary: Dict[str, Any] = {
+            "type": stats["types"].most_common(1)[0][0],
+            "non_empty": sum(stats["values"].values()),
+            "distinct": len(stats["values"]),
+        }
+        if stats["min"] is not None:
+            summary["min"] = {key: stats["min"]}
+            summary["max"] = {key: stats["max"]}
+        if summary["distinct"] < len(docs):  # skip unique columns such as ids and emails
+            summary["top_values"] = [
+                {key: stats["originals"][marker], "count": count}
+                for marker, count in stats["values"].most_common(top_values)
+            ]
+        field_summaries[key] = summary
+
+    return {
+        "total_rows": len(docs),
+        "fields": field_summaries,
+        "first_rows": docs[:sample_rows],
+    }
+
+
+class ResultStore:
+    """In-process store of full, unmasked results, addressed by handle.
+
+    Bounded to `max_entries` results (least recently used dropped first),
+    each kept for `ttl` seconds.
+    """
+
+    def __init__(self, max_entries: int = 32, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(
+        self, docs: List[Dict[str, Any]], collection: str, pipeline: List[Dict[str, Any]], truncated: bool = False
+    ) -> str:
+        """Keep `docs`; `truncated` records that the query returned more rows than these."""
+        handle = uuid.uuid4().hex[:12]
+        entry = {
+            "collection": collection,
+            "pipeline": pipeline,
+            "docs": docs,
+            "truncated": truncated,
+            "created_at": datetime.now(),
+        }
+        with self._lock:
+            self._entries[handle] = (time.monotonic() + self.ttl, entry)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return handle
+
+    def get(self, handle: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._entries.get(handle)
+            if item is None:
+                return None
+            if item[0] <= time.monotonic():
+                del self._entries[handle]
+                return None
+            self._entries.move_to_end(handle)
+            return item[1]
+
+    def export(self, handle: str, path: str) -> int:
+        """Write the full result as Extended JSON to `path`; returns the row count."""
+        entry = self.get(handle)
+        if entry is None:
+            raise KeyError(f"No stored result for handle {handle!r} (expired or unknown)")
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write(dumps(entry["docs"], indent=2))
+        return len(entry["docs"])
+
+
+def summary_text(masked_summary: Dict[str, Any], handle: Optional[str], truncated: bool = False) -> str:
+    rows = masked_summary["total_rows"]
+    if handle and truncated:
+        stored = f" Only the first {rows} rows are stored, under handle {handle}."
+    elif handle:
+        stored = f" The full result ({rows} rows) is stored under handle {handle}."
+    else:
+        stored = ""
+    shown = f"at least {rows} rows (truncated)" if truncated else f"{rows} rows"
+    return (
+        f"Result too large to list: {shown}, summarized below.{stored} "
+        "Use $group/$count or a narrower $match to get specific rows.\n"
+        + json.dumps(to_plain(masked_summary), separators=(",", ":"), ensure_ascii=False)
+    )
@@ -290,6 +290,8 @@ load_dotenv("./.env")
 # Use new OpenAI client API
 from openai import OpenAI
 
+from Tracing import record_usage, span
+
 # ----------------------------- CONFIG ---------------------------------
 DEFAULT_MODEL = "gpt-3.5-turbo"
 MAX_RETRIES = 3
@@ -354,6 +356,14 @@ Classify according to the SYSTEM instructions above. Return only JSON.
 
 # ------------------------ Utilities & Fallbacks -------------------------
 
+def _chat_completion(client: OpenAI, stage: str, **kwargs: Any):
+    """client.chat.completions.create, traced as a router.<stage> span with token usage."""
+    with span(f"router.{stage}", model=kwargs.get("model")) as s:
+        resp = client.chat.completions.create(**kwargs)
+        if resp.usage is not None:
+            record_usage(s, resp.usage.prompt_tokens, resp.usage.completion_tokens)
+        return resp
+
 def _parse_json_safe(text: str) -> Optional[Dict[str, Any]]:
     try:
         return json.loads(text)
@@ -432,7 +442,9 @@ def enforce_binary_decision_with_model(client: OpenAI, query: str, model: str) -
               "Interpret 'policy' as requiring normative HR policy interpretation.")
     user = f"Decide for query: \"{query}\". Reply only with policy or document."
     try:
-        resp = client.chat.completions.create(
+        resp = _chat_completion(
+            client,
+            "enforce_binary",
             model=model,
             messages=[{"role":"system","content":system},{"role":"user","content":user}],
             temperature=0.0,
@@ -461,7 +473,9 @@ def generate_split_queries_with_model(client: OpenAI, query: str, model: str) ->
               "policy_query should be a short instruction for the policy reasoning script (e.g., 'Explain leave encashment policy for probation employees').")
     user = f"Original query: \"{query}\". Produce JSON {{\"doc_query\":\"...\",\"policy_query\":\"...\"}}."
     try:
-        resp = client.chat.completions.create(
+        resp = _chat_completion(
+            client,
+            "split_queries",
             model=model,
             messages=[{"role":"system","content":system},{"role":"user","content":user}],
             temperature=0.0,
@@ -509,7 +523,9 @@ def classify_query(
     primary_parsed = None
     for attempt in range(1, MAX_RETRIES + 1):
         try:
-            resp = client.chat.completions.create(
+            resp = _chat_completion(
+                client,
+                "classify",
                 model=model,
                 messages=[{"role":"system","content":system_msg},{"role":"user","content":user_msg}],
                 temperature=0.0,
@@ -0,0 +1,104 @@
+"""
+Compact, masked schema digest for the agent's system prompt.
+
+Without it every question starts with two or three tool turns (list the
+collections, fetch their schema) before the agent writes a pipeline. The
+digest is built once per process from a $sample of each collection:
+
+    - base_report (1292 docs): employee code:number, department:string{Finance|Technology|...}, ...
+
+Nested documents (offboarding's two-row header) are flattened to dotted
+paths such as `core hr.employee id`, the names pipelines use.
+
+Only values of low-cardinality string fields are listed ("key enum
+values"), and only if the toolkit's masker leaves them untouched: any
+field the masker would tokenize (names, emails, ids) is listed with its
+type alone. The digest is shrunk step by step until it fits `token_budget`
+(fewer enum values, then none, then fewer fields per collection).
+"""
+
+from typing import Any, Dict, List, Optional
+
+from ResultFormatter import count_tokens
+from ResultSummary import summarize
+
+DIGEST_HEADER = "Database schema digest (sampled; field:type, common values in {...}):"
+# (max enum values, max fields per collection) tried in order until the digest fits
+DIGEST_LEVELS = [(8, None), (3, None), (0, None), (0, 20), (0, 8)]
+
+
+def flatten(doc: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    """`doc` with embedded documents expanded to dotted paths."""
+    flat: Dict[str, Any] = {}
+    for key, value in doc.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict) and value:
+            flat.update(flatten(value, f"{path}."))
+        else:
+            flat[path] = value
+    return flat
+
+
+def _is_masked(masker, field: str, value: Any) -> bool:
+    # Maskers decide on the key itself, i.e. the last segment of a dotted path
+    key = field.rsplit(".", 1)[-1]
+    masked, _ = masker.mask({key: value})
+    return masked[key] != value
+
+
+def describe_collection(toolkit, collection: str, sample_size: int = 200, max_distinct: int = 15) -> Dict[str, Any]:
+    """Doc count plus, per field, its type and (for enum-like fields) common values."""
+    coll = toolkit._physical_collection(collection)
+    docs = list(coll.aggregate([{"$sample": {"size": sample_size}}]))
+    for doc in docs:
+        if "_id" in doc:
+            del doc["_id"]
+    docs = [flatten(doc) for doc in docs]
+    stats = summarize(docs, sample_rows=0, top_values=max_distinct)["fields"]
+
+    fields = {}
+    for field, summary in stats.items():
+        values = []
+        # enum-like: few distinct values, each seen at least twice on average
+        if summary["type"] == "string" and 1 < summary["distinct"] <= min(max_distinct, len(docs) // 2):
+            values = [item[field] for item in summary.get("top_values", [])]
+            if any(_is_masked(toolkit.piiMasker, field, value) for value in values):
+                values = []
+        fields[field] = {"type": summary["type"], "values": values}
+    return {"count": coll.estimated_document_count(), "fields": fields}
+
+
+def render_digest(descriptions: Dict[str, Dict[str, Any]], max_values: int, max_fields: Optional[int]) -> str:
+    lines = [DIGEST_HEADER]
+    for collection, description in descriptions.items():
+        parts = []
+        items = list(description["fields"].items())
+        for field, info in items[:max_fields]:
+            part = f"{field}:{info['type']}"
+            if max_values and info["values"]:
+                part += "{" + "|".join(str(v) for v in info["values"][:max_values]) + "}"
+            parts.append(part)
+        if max_fields is not None and len(items) > max_fields:
+            parts.append(f"... +{len(items) - max_fields} more")
+        lines.append(f"- {collection} ({description['count']} docs): " + ", ".join(parts))
+    return "\n".join(lines)
+
+
+def build_schema_digest(
+    toolkit,
+    collections: Optional[List[str]] = None,
+    token_budget: int = 2000,
+    sample_size: int = 200,
+) -> str:
+    """Digest of `collections` (default: all usable ones) within `token_budget` tokens."""
+    names = collections if collections is not None else toolkit.get_usable_collection_names()
+    descriptions = {name: describe_collection(toolkit, name, sample_size) for name in names}
+    toolkit.piiMasker.reset()
+
+    digest = ""
+    for max_values, max_fields in DIGEST_LEVELS:
+        digest = render_digest(descriptions, max_values, max_fields)
+        if count_tokens(digest) <= token_budget:
+            return digest
+    # Still too long: collection names only
+    return "\n".join([DIGEST_HEADER] + [f"- {name}" for name in descriptions])
@@ -0,0 +1,303 @@
+"""
+Semantic cache from (masked) questions to validated aggregation pipelines.
+
+Most questions are one of a few shapes with different literals:
+"how much balance leave is there for emp id 4598?", "... emp id 245?".
+After the agent answers a question, the pipeline of the last mongodb_query
+command that ran without error is stored together with the question's
+slots: numbers, quoted strings and capitalized words after the first word
+(names, departments, regions, mask tokens such as "[Primary Email 0]").
+
+Each slot is bound to the one place in the parsed pipeline where its value
+is used as a literal: a $match value, a comparison operand ($eq, $gte,
+$in, $regex, ...) or a $limit / $skip. Sort directions, projection flags
+and accumulator operands such as {"$sum": 1} are never slot positions. A
+pipeline is not cached when a slot value is missing from the literal
+positions, or occurs in more than one of them (it is ambiguous which one
+the question meant). A year slot binds to the dates of that year and the
+next, so a [2022-01-01, 2023-01-01) range moves as a whole. Nor is it
+cached when a string literal of the pipeline appears as a word of the
+question without being a slot ("west region" -> {"region": "West"}): word
+vectors rate west/east or active/inactive as close, so such a value must
+not be left to the similarity check.
+
+A new question is reduced to a template ("how much balance leave is there
+for emp id <num>?") and embedded with the shared spaCy model from
+ModelRegistry. A cached entry is a hit when:
+
+- the template vectors' cosine similarity is at least `threshold`,
+- every content word that differs between the two templates has a close
+  counterpart in the other one ("joined" vs "resigned" is not close),
+- both questions have the same kinds of slots in the same order,
+- every template word that also occurs in a string literal of the cached
+  pipeline is in the new template too.
+
+On a hit, the new slot values are written at the bound positions only, and
+`lookup` returns the re-rendered command; the caller can run it without
+the LLM.
+"""
+
+import copy
+import re
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Pattern, Tuple, Union
+
+import numpy as np
+
+from ModelRegistry import get_spacy_model
+from QueryTemplates import render_command
+
+SLOT_PATTERN = re.compile(
+    r"(?P<token>\[[^\[\]]+ \d+\])"                     # mask tokens
+    r"|[\"'](?P<quoted>[^\"']+)[\"']"                  # quoted strings
+    r"|(?P<num>\b\d+(?:\.\d+)?\b)"                     # ids, years, amounts
+    r"|(?P<name>\b[A-Z][\w&-]*(?:\s+[A-Z][\w&-]*)*\b)"  # names, departments, regions
+)
+SLOT_PLACEHOLDERS = {"token": "<TOKEN>", "quoted": "<TEXT>", "num": "<NUM>", "name": "<NAME>"}
+CONTENT_POS = {"NOUN", "PROPN", "VERB", "ADJ", "ADV", "NUM"}
+COMMAND_COLLECTION = re.compile(r"^db\.([^.]+)\.")
+YEAR = re.compile(r"^(19|20)\d\d$")
+# Operators whose operands are values, and stages whose argument is one
+LITERAL_OPERATORS = {"$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin", "$all", "$regex"}
+LITERAL_STAGES = {"$limit", "$skip"}
+# Query operators whose argument is again a filter
+FILTER_OPERATORS = {"$and", "$or", "$nor", "$not", "$elemMatch"}
+
+
+def extract_slots(question: str) -> Tuple[str, List[Tuple[str, str]]]:
+    """Return the question template and its (kind, value) slots, in order."""
+    slots: List[Tuple[str, str]] = []
+    parts: List[str] = []
+    last = 0
+    for match in SLOT_PATTERN.finditer(question):
+        kind = match.lastgroup
+        if kind == "name" and (not question[:match.start()].strip() or match.group() == "I"):
+            continue  # sentence-initial capital or the pronoun
+        slots.append((kind, match.group(kind)))
+        parts.append(question[last:match.start()])
+        parts.append(SLOT_PLACEHOLDERS[kind])
+        last = match.end()
+    parts.append(question[last:])
+    return "".join(parts).strip().lower(), slots
+
+
+Path = Tuple[Union[str, int], ...]
+
+
+def literal_positions(node: Any, path: Path = (), mode: str = "expr") -> Iterator[Tuple[Path, Any]]:
+    """(path, value) of every literal in a pipeline a question can parameterize.
+
+    `mode` is "expr" for stages and expressions (values are structural),
+    "filter" inside a $match query and "literal" for operator operands.
+    """
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key in LITERAL_OPERATORS or key in LITERAL_STAGES:
+                child = "literal"
+            elif key == "$match" or (mode == "filter" and (key in FILTER_OPERATORS or not key.startswith("$"))):
+                child = "filter"
+            elif mode == "literal":
+                child = "literal"
+            else:
+                child = "expr"
+            yield from literal_positions(value, path + (key,), child)
+    elif isinstance(node, list):
+        for index, item in enumerate(node):
+            yield from literal_positions(item, path + (index,), mode)
+    elif mode != "expr" and not (isinstance(node, str) and node.startswith("$")):
+        yield path, node
+
+
+def _word(value: str) -> Pattern:
+    return re.compile(rf"(?<!\w){re.escape(value)}(?!\w)", re.IGNORECASE)
+
+
+def template_words(template: str) -> set:
+    """The plain words of a template, placeholders left out."""
+    return set(re.findall(r"\w+", re.sub(r"<[a-z]+>", " ", template)))
+
+
+def _slot_matches(kind: str, value: str, literal: Any) -> bool:
+    if isinstance(literal, bool):
+        return False
+    if isinstance(literal, datetime):
+        return kind == "num" and bool(YEAR.match(value)) and literal.year in (int(value), int(value) + 1)
+    if isinstance(literal, (int, float)):
+        return kind == "num" and float(value) == literal
+    if isinstance(literal, str):
+        return _word(value).search(literal) is not None
+    return False
+
+
+def bind_slots(pipeline: List[Dict[str, Any]], slots: List[Tuple[str, str]]) -> Optional[List[List[Path]]]:
+    """The literal positions each slot is bound to, or None if a slot is
+    missing, ambiguous or shares a position with another slot."""
+    positions = list(literal_positions(pipeline))
+    bindings: List[List[Path]] = []
+    taken = set()
+    for kind, value in slots:
+        paths = [path for path, literal in positions if _slot_matches(kind, value, literal)]
+        dates = [path for path in paths if isinstance(_get(pipeline, path), datetime)]
+        if not paths or len(paths) - len(dates) > 1 or taken.intersection(paths):
+            return None
+        taken.update(paths)
+        bindings.append(paths)
+    return bindings
+
+
+def _get(node: Any, path: Path) -> Any:
+    for key in path:
+        node = node[key]
+    return node
+
+
+def _substitute(literal: Any, old: str, new: str) -> Any:
+    if isinstance(literal, datetime):
+        return literal.replace(year=literal.year + int(new) - int(old))
+    if isinstance(literal, (int, float)):
+        number = float(new)
+        return int(number) if isinstance(literal, int) and number.is_integer() else number
+    return _word(old).sub(lambda _: new, literal)
+
+
+def reparameterize(
+    pipeline: List[Dict[str, Any]], bindings: List[List[Path]], old: List[Tuple[str, str]], new: List[Tuple[str, str]]
+) -> Optional[List[Dict[str, Any]]]:
+    """A copy of `pipeline` with each old slot value replaced by the new one
+    at its bound positions; None when the slots do not line up."""
+    if [kind for kind, _ in old] != [kind for kind, _ in new]:
+        return None
+    pipeline = copy.deepcopy(pipeline)
+    try:
+        for paths, (_, old_value), (_, new_value) in zip(bindings, old, new):
+            for path in paths:
+                parent = _get(pipeline, path[:-1])
+                parent[path[-1]] = _substitute(parent[path[-1]], old_value, new_value)
+    except ValueError:
+        return None  # e.g. 29 February moved to a year without it
+    return pipeline
+
+
+@dataclass
+class CachedQuery:
+    template: str
+    slots: List[Tuple[str, str]]
+    pipeline: List[Dict[str, Any]]
+    bindings: List[List[Path]]
+    collection: str
+    vector: np.ndarray
+    terms: List
+    # Template words that are (part of) a string literal of the pipeline
+    literal_words: frozenset = frozenset()
+    hits: int = 0
+
+
+class SemanticQueryCache:
+    """Bounded in-process cache; the least recently used entry is dropped first."""
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        term_similarity: float = 0.75,
+        max_entries: int = 512,
+        model: Optional[str] = None,
+    ):
+        self.threshold = threshold
+        self.term_similarity = term_similarity
+        self.max_entries = max_entries
+        self.model = model
+        self._entries: List[CachedQuery] = []
+        self._lock = threading.Lock()
+
+    def _embed(self, template: str):
+        doc = get_spacy_model(self.model)(template)
+        vector = doc.vector
+        norm = np.linalg.norm(vector)
+        vector = vector / norm if norm else vector
+        terms = [t for t in doc if t.pos_ in CONTENT_POS and not t.is_stop]
+        return vector, terms
+
+    def _terms_compatible(self, a: List, b: List) -> bool:
+        lemmas_a = {t.lemma_.lower() for t in a}
+        lemmas_b = {t.lemma_.lower() for t in b}
+        for source, other, other_lemmas in ((a, b, lemmas_b), (b, a, lemmas_a)):
+            for term in source:
+                if term.lemma_.lower() in other_lemmas:
+                    continue
+                if not term.has_vector or not any(
+                    o.has_vector and term.similarity(o) >= self.term_similarity for o in other
+                ):
+                    return False
+        return True
+
+    def lookup(self, question: str) -> Optional[str]:
+        """A command answering `question`, re-parameterized from a cached one."""
+        template, slots = extract_slots(question)
+        words = template_words(template)
+        vector, terms = self._embed(template)
+        with self._lock:
+            candidates = sorted(
+                ((float(np.dot(vector, entry.vector)), entry) for entry in self._entries),
+                key=lambda item: -item[0],
+            )
+            for score, entry in candidates:
+                if score < self.threshold:
+                    break
+                if not entry.literal_words <= words:
+                    continue  # e.g. "west" in the cached question, "east" in this one
+                if not self._terms_compatible(terms, entry.terms):
+                    continue
+                pipeline = reparameterize(entry.pipeline, entry.bindings, entry.slots, slots)
+                if pipeline is None:
+                    continue
+                entry.hits += 1
+                self._entries.remove(entry)
+                self._entries.append(entry)
+                print(f"[SemanticQueryCache] hit ({score:.3f}) for template: {entry.template}")
+                return render_command(entry.collection, pipeline)
+        return None
+
+    def put(self, question: str, command: str, pipeline: List[Dict[str, Any]]) -> bool:
+        """Remember `command`, whose parsed pipeline is `pipeline`, as the
+        answer to `question`; False if not cacheable."""
+        match = COMMAND_COLLECTION.match(command)
+        if match is None:
+            return False
+        template, slots = extract_slots(question)
+        bindings = bind_slots(pipeline, slots)
+        if bindings is None:
+            return False  # a slot value is missing or ambiguous
+        bound = {path for paths in bindings for path in paths}
+        strings = [(path, literal) for path, literal in literal_positions(pipeline) if isinstance(literal, str)]
+        if any(path not in bound and _word(literal).search(question) for path, literal in strings):
+            return False  # a value from the question that is not a slot
+        literal_words = frozenset(
+            word for word in template_words(template)
+            if any(_word(word).search(literal) for _, literal in strings)
+        )
+        try:
+            render_command(match.group(1), pipeline)
+        except TypeError:
+            return False  # a value the command syntax cannot express
+        vector, terms = self._embed(template)
+        with self._lock:
+            self._entries = [e for e in self._entries if e.template != template]
+            self._entries.append(
+                CachedQuery(template, slots, pipeline, bindings, match.group(1), vector, terms, literal_words)
+            )
+            while len(self._entries) > self.max_entries:
+                self._entries.pop(0)
+        return True
+
+    def invalidate(self, collection: Optional[str] = None) -> None:
+        """Drop the entries reading `collection` (all entries when None)."""
+        with self._lock:
+            if collection is None:
+                self._entries.clear()
+            else:
+                self._entries = [e for e in self._entries if e.collection != collection]
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,284 @@
+"""
+Ingest-time pseudonymization of the `hr` collections.
+
+For every source collection `<name>` a shadow copy `<name>__masked` is
+written in which the PII fields (same key rules as FieldBasedPIIMasker) are
+replaced by stable tokens such as "[Email 3f9a1c2b7d0e]". A token is an
+HMAC of the value, labelled with a class derived from the value alone
+(Email, Code or Name), so the same value always gets the same token in
+every field, collection and rebuild: a manager code matches the employee
+code it refers to, and base_report joins offboarding or leave_transaction
+on the tokenized employee code. The token -> value mapping lives in the
+`pii_vault` collection, keyed (and therefore indexed) by `_id`.
+
+At query time MongoDBDatabasePIIToolkit(use_shadow_collections=True) runs
+the LLM-generated pipelines against the shadow collections without masking
+anything, and VaultTokenResolver resolves only the tokens that appear in
+the final answer with one `$in` lookup.
+
+The agent only ever sees tokens for PII fields. Equality filters it writes
+with raw values ({"employee code": 4598}) are rewritten to the token by the
+toolkit (see `StableTokenMasker.tokenize_filter`); any other condition on a
+PII field (ranges, $regex, ...) cannot match a token and is rejected.
+
+PII_VAULT_SECRET must be set, both at ingest and for the shadow-mode
+toolkit: employee codes, emails and names come from small, guessable sets,
+so unkeyed hashes of them could be reversed by brute force.
+
+Usage:
+    python src/ShadowCollections.py            # refresh the rollups, rebuild all shadow copies
+"""
+
+import hashlib
+import hmac
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.database import Database
+
+from HRRollups import is_rollup_collection, refresh_rollups
+from RegexPIIMasker import FieldBasedPIIMasker
+
+SHADOW_SUFFIX = "__masked"
+VAULT_COLLECTION = "pii_vault"
+# Tokens produced by StableTokenMasker, e.g. "[Email 3f9a1c2b7d0e]"
+STABLE_TOKEN_PATTERN = re.compile(r"\[[^\[\]]+ [0-9a-f]{12}\]")
+
+
+def shadow_name(collection: str) -> str:
+    return f"{collection}{SHADOW_SUFFIX}"
+
+
+def is_internal_collection(collection: str) -> bool:
+    """Shadow copies and the vault are never exposed to the agent directly."""
+    return collection.endswith(SHADOW_SUFFIX) or collection == VAULT_COLLECTION
+
+
+class StableTokenMasker(FieldBasedPIIMasker):
+    """FieldBasedPIIMasker variant whose tokens depend only on the value."""
+
+    def __init__(self, secret: Optional[str] = None, custom_pii_fields=None):
+        super().__init__(custom_pii_fields)
+        secret = secret or os.getenv("PII_VAULT_SECRET", "")
+        if not secret:
+            raise ValueError(
+                "PII_VAULT_SECRET is not set; without a key the tokens are plain hashes "
+                "of guessable values (codes, emails, names) and can be reversed."
+            )
+        self.secret = secret.encode("utf-8")
+
+    def token_for(self, value: Any) -> str:
+        """Token of `value`, the same whichever field or collection it is in."""
+        text = str(value)
+        digest = hmac.new(self.secret, text.encode("utf-8"), hashlib.sha256).hexdigest()
+        return f"[{self._value_class(text)} {digest[:12]}]"
+
+    @staticmethod
+    def _value_class(text: str) -> str:
+        if "@" in text:
+            return "Email"
+        if any(ch.isdigit() for ch in text) and not any(ch.isspace() for ch in text):
+            return "Code"
+        return "Name"
+
+    def tokenize_filter(self, query: Any) -> Any:
+        """Rewrite equality literals on PII fields of a $match filter to tokens.
+
+        {"employee code": 4598} becomes {"employee code": "[Code 3f9a1c2b7d0e]"};
+        $eq, $ne, $in and $nin operands are rewritten the same way and values
+        that already are tokens are kept. Any other operator on a PII field
+        raises ValueError, since it would silently match nothing.
+        """
+        if isinstance(query, list):
+            return [self.tokenize_filter(item) for item in query]
+        if not isinstance(query, dict):
+            return query
+        rewritten = {}
+        for key, value in query.items():
+            if key in ("$and", "$or", "$nor"):
+                value = self.tokenize_filter(value)
+            elif not key.startswith("$"):
+                field = key.rsplit(".", 1)[-1]
+                if self._is_pii_key(field.replace("_", " ").strip().lower()):
+                    value = self._tokenize_condition(key, value)
+            rewritten[key] = value
+        return rewritten
+
+    def _tokenize_condition(self, path: str, condition: Any) -> Any:
+        if not (isinstance(condition, dict) and any(op.startswith("$") for op in condition)):
+            return self._token_literal(condition)
+        rewritten = {}
+        for op, operand in condition.items():
+            if op in ("$eq", "$ne"):
+                rewritten[op] = self._token_literal(operand)
+            elif op in ("$in", "$nin") and isinstance(operand, list):
+                rewritten[op] = [self._token_literal(value) for value in operand]
+            elif op == "$exists":
+                rewritten[op] = operand
+            else:
+                raise ValueError(
+                    f"{path!r} holds pseudonymized tokens in shadow mode; only $eq, $ne, $in, "
+                    f"$nin and $exists filters work on it, not {op}."
+                )
+        return rewritten
+
+    def _token_literal(self, value: Any) -> Any:
+        if value is None or value == "" or isinstance(value, (dict, list)):
+            return value
+        if isinstance(value, str) and STABLE_TOKEN_PATTERN.fullmatch(value):
+            return value
+        return self.token_for(value)
+
+    def _mask_value(self, key: str, value: Any) -> Any:
+        if isinstance(value, (dict, list)):
+            return super()._mask_value(key, value)
+        if key == "_id":
+            return value
+
+        normalized_key = key.replace("_", " ").strip().lower()
+        if value not in (None, "") and self._is_pii_key(normalized_key):
+            token = self.token_for(value)
+            # Keep the original type so the vault returns e.g. ints for codes
+            self.mapping[token] = value
+            return token
+        return value
+
+
+class ShadowCollectionBuilder:
+    """Writes pseudonymized shadow copies of a database's collections."""
+
+    def __init__(
+        self,
+        db: Database,
+        masker: Optional[StableTokenMasker] = None,
+        batch_size: int = 1000,
+        result_cache=None,
+    ):
+        self.db = db
+        self.masker = masker or StableTokenMasker()
+        self.batch_size = batch_size
+        # AggregationCache to invalidate once a shadow copy is replaced
+        self.result_cache = result_cache
+
+    def source_collections(self) -> List[str]:
+        return sorted(
+            name for name in self.db.list_collection_names()
+            if not is_internal_collection(name)
+            and not is_rollup_collection(name)
+            and not name.startswith("system.")
+        )
+
+    def build(self, collections: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """Rebuild the shadow copy of each collection; returns documents written per collection."""
+        counts = {}
+        for name in collections or self.source_collections():
+            counts[name] = self.build_collection(name)
+        return counts
+
+    def build_collection(self, name: str) -> int:
+        target = shadow_name(name)
+        staging = self.db[f"{name}__staging{SHADOW_SUFFIX}"]
+        staging.drop()
+
+        written = 0
+        batch: List[Dict[str, Any]] = []
+        for doc in self.db[name].find({}, batch_size=self.batch_size):
+            batch.append(doc)
+            if len(batch) >= self.batch_size:
+                written += self._write_batch(staging, batch)
+                batch = []
+        if batch:
+            written += self._write_batch(staging, batch)
+
+        if written:
+            # Swap in the new copy in one step so queries never see a partial one
+            staging.rename(target, dropTarget=True)
+        else:
+            self.db[target].drop()
+        if self.result_cache is not None:
+            # Shadow-mode pipelines join on the shadow names
+            self.result_cache.invalidate(name)
+            self.result_cache.invalidate(target)
+        print(f"[S] {name} -> {target}  (records: {written})")
+        return written
+
+    def _write_batch(self, staging, docs: List[Dict[str, Any]]) -> int:
+        masked, mapping = self.masker.mask(docs)
+        staging.insert_many(masked, ordered=False)
+        if mapping:
+            self.db[VAULT_COLLECTION].bulk_write(
+                [
+                    UpdateOne({"_id": token}, {"$setOnInsert": {"value": value}}, upsert=True)
+                    for token, value in mapping.items()
+                ],
+                ordered=False,
+            )
+        return len(masked)
+
+
+class VaultTokenResolver:
+    """Masker for the toolkit in shadow mode.
+
+    Query results are already pseudonymized, so `mask` passes data through
+    untouched; `unmask` looks up every stable token found in the answer in
+    the vault with a single `$in` query.
+    """
+
+    def __init__(self, db: Database):
+        self.vault = db[VAULT_COLLECTION]
+        self.mapping: Dict[str, str] = {}
+
+    def mask(self, data: Any, reset: bool = True, collection: Optional[str] = None):
+        if reset:
+            self.reset()
+        return data, self.mapping
+
+    def reset(self) -> None:
+        self.mapping = {}
+
+    def unmask(self, data: Any) -> Any:
+        tokens = set()
+        self._collect_tokens(data, tokens)
+        missing = [token for token in tokens if token not in self.mapping]
+        if missing:
+            for entry in self.vault.find({"_id": {"$in": missing}}):
+                self.mapping[entry["_id"]] = str(entry["value"])
+        return self._unmask_recursive(data)
+
+    def _collect_tokens(self, obj: Any, tokens: set) -> None:
+        if isinstance(obj, dict):
+            for value in obj.values():
+                self._collect_tokens(value, tokens)
+        elif isinstance(obj, list):
+            for item in obj:
+                self._collect_tokens(item, tokens)
+        elif isinstance(obj, str):
+            tokens.update(STABLE_TOKEN_PATTERN.findall(obj))
+
+    def _unmask_recursive(self, obj: Any) -> Any:
+        if isinstance(obj, dict):
+            return {k: self._unmask_recursive(v) for k, v in obj.items()}
+        elif isinstance(obj, list):
+            return [self._unmask_recursive(item) for item in obj]
+        elif isinstance(obj, str):
+            return STABLE_TOKEN_PATTERN.sub(lambda m: self.mapping.get(m.group(), m.group()), obj)
+        return obj
+
+
+def main():
+    from dotenv import load_dotenv
+    from MongoClientManager import get_client
+
+    load_dotenv(os.path.join(os.getcwd(), ".env"))
+    client = get_client(os.getenv("MONGODB_URI"))
+    # Rollups are computed from the raw collections and hold no PII
+    refresh_rollups(client["hr"])
+    builder = ShadowCollectionBuilder(client["hr"])
+    counts = builder.build()
+    print(f"\nAll done. {sum(counts.values())} documents in {len(counts)} collections.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from JSONPIIMasker import JSONPIIMasker
+from RegexPIIMasker import FieldBasedPIIMasker
+
+# Keywords for fields that never carry PII (enums, dates, org structure)
+SAFE_KEYWORDS = [
+    "date",
+    "doj",
+    "dob",
+    "dor",
+    "dol",
+    "grade",
+    "level",
+    "status",
+    "type",
+    "region",
+    "department",
+    "dept",
+    "location",
+    "office",
+    "state",
+    "circle",
+    "designation",
+    "job",
+    "category",
+    "unit",
+    "rating",
+    "period",
+    "duration",
+    "balance",
+    "weight",
+    "title",
+    "m/f",
+    "gender",
+]
+
+# Per-key decisions
+PII = "pii"
+SAFE = "safe"
+FREE_TEXT = "free_text"
+
+
+class TieredPIIMasker(FieldBasedPIIMasker):
+    """Key rules first, NER only where the key rules cannot decide.
+
+    - keys that FieldBasedPIIMasker treats as PII are tokenized directly;
+    - keys in SAFE_KEYWORDS, and any non-string value, are left untouched;
+    - the remaining free-text strings (remarks, comments, descriptions) are
+      sent through JSONPIIMasker's spaCy + regex detection in one batch.
+
+    The decision for every key is cached per collection, and tokens from
+    both tiers share one mapping in the `[Label n]` format.
+    """
+
+    def __init__(
+        self,
+        custom_pii_fields=None,
+        custom_safe_fields=None,
+        ner_masker: Optional[JSONPIIMasker] = None,
+    ):
+        super().__init__(custom_pii_fields)
+        self.custom_safe_fields = set(f.lower() for f in (custom_safe_fields or []))
+        self.safe_pattern = re.compile(
+            r"|".join(rf"(?<!\w){re.escape(kw)}(?!\w)" for kw in SAFE_KEYWORDS), re.IGNORECASE
+        )
+        # Created on first free-text value; the spaCy model itself is shared
+        self.ner_masker = ner_masker
+        self.key_decisions: Dict[str, Dict[str, str]] = {}
+        self._free_text_leaves: List[Tuple[Any, Any, str]] = []
+
+    def mask(self, data: Any, reset: bool = True, collection: Optional[str] = None) -> Tuple[Any, Dict[str, str]]:
+        """Mask PII in JSON-like dict or list, using the key decisions of `collection`."""
+        if reset:
+            self.reset()
+        decisions = self.key_decisions.setdefault(collection or "", {})
+        self._free_text_leaves = []
+
+        root: Dict[str, Any] = {}
+        self._mask_into(root, "data", None, data, decisions)
+        if self._free_text_leaves:
+            self._mask_free_text(self._free_text_leaves)
+            self._free_text_leaves = []
+        return root["data"], self.mapping
+
+    def _mask_into(self, container, slot, key: Optional[str], value: Any, decisions: Dict[str, str]) -> None:
+        """Write the masked `value` into container[slot]."""
+        if isinstance(value, dict):
+            masked: Dict[str, Any] = {}
+            container[slot] = masked
+            for k, v in value.items():
+                self._mask_into(masked, k, k, v, decisions)
+        elif isinstance(value, list):
+            items: List[Any] = [None] * len(value)
+            container[slot] = items
+            for index, item in enumerate(value):
+                self._mask_into(items, index, key, item, decisions)
+        else:
+            tier = self._key_tier(key, decisions)
+            if tier == PII:
+                token = self._get_mask_token(key.title())
+                self.mapping[token] = str(value)
+                container[slot] = token
+            else:
+                container[slot] = value
+                if tier == FREE_TEXT and isinstance(value, str) and value.strip():
+                    self._free_text_leaves.append((container, slot, value))
+
+    def _key_tier(self, key: Optional[str], decisions: Dict[str, str]) -> str:
+        if key is None:
+            return FREE_TEXT
+        tier = decisions.get(key)
+        if tier is None:
+            normalized_key = key.replace("_", " ").strip().lower()
+            if self._is_pii_key(normalized_key):
+                tier = PII
+            elif self._is_safe_key(normalized_key):
+                tier = SAFE
+            else:
+                tier = FREE_TEXT
+            decisions[key] = tier
+        return tier
+
+    def _is_safe_key(self, key: str) -> bool:
+        return key in self.custom_safe_fields or bool(self.safe_pattern.search(key))
+
+    def _mask_free_text(self, leaves: List[Tuple[Any, Any, str]]) -> None:
+        if self.ner_masker is None:
+            self.ner_masker = JSONPIIMasker()
+        spans = self.ner_masker.detect_entities_batch([text for _, _, text in leaves])
+        for (container, slot, text), text_spans in zip(leaves, spans):
+            container[slot] = self._apply_spans(text, text_spans)
+
+    def _apply_spans(self, text: str, spans) -> str:
+        if not spans:
+            return text
+        parts = []
+        position = 0
+        for start, end, label in spans:
+            token = self._get_mask_token(label.replace("_", " ").title())
+            self.mapping[token] = text[start:end]
+            parts.append(text[position:start])
+            parts.append(token)
+            position = end
+        parts.append(text[position:])
+        return "".join(parts)
@@ -0,0 +1,244 @@
+"""
+Request tracing: nested, timed spans around each stage of a request.
+
+    with span("request", request_type="document") as root:
+        with span("router.classify"):
+            ...
+        with span("mongo.aggregate", collection="base_report") as s:
+            docs = ...
+            s.set(docs_returned=len(docs))
+
+The current span is kept in a ContextVar, so spans opened in the toolkit,
+the maskers or LangGraph nodes (LangChain copies the context into its
+worker threads) become children of the request span. LLM calls made
+through LangChain are traced by passing `TracingCallbackHandler()` in the
+run config; each call becomes an "llm" span with the model and the
+prompt / completion token counts.
+
+Finished spans are written as JSON lines to Outputs/traces/<date>.jsonl under
+the repository root (or TRACE_DIR), one object per span:
+
+    {"trace_id", "span_id", "parent_id", "name", "start", "duration_ms", "status", "attributes"}
+
+When OTEL_EXPORTER_OTLP_ENDPOINT is set and the OpenTelemetry SDK with the
+OTLP/HTTP exporter is installed, spans are sent there instead. Set
+TRACING=0 to disable tracing.
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+TRACING_ENABLED = os.getenv("TRACING", "1").lower() not in ("0", "false", "no")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRACE_DIR = os.getenv("TRACE_DIR", os.path.join(REPO_ROOT, "Outputs", "traces"))
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "mongo-rag")
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class JsonlExporter:
+    """Appends one JSON object per finished span to a daily file."""
+
+    def __init__(self, directory: str = TRACE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def start(self, span: "Span") -> Any:
+        return None
+
+    def finish(self, span: "Span") -> None:
+        line = json.dumps(span.to_dict(), default=str, ensure_ascii=False)
+        path = os.path.join(self.directory, f"{datetime.now():%Y-%m-%d}.jsonl")
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as fh:
+                fh.write(line + "\n")
+
+
+class OtlpExporter:
+    """Mirrors each span as an OpenTelemetry span, exported over OTLP/HTTP."""
+
+    def __init__(self):
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+        provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        self._trace = trace
+        self._tracer = provider.get_tracer(__name__)
+
+    def start(self, span: "Span") -> Any:
+        parent = span.parent._exported if span.parent is not None else None
+        context = self._trace.set_span_in_context(parent) if parent is not None else None
+        return self._tracer.start_span(span.name, context=context, start_time=int(span.start * 1e9))
+
+    def finish(self, span: "Span") -> None:
+        otel_span = span._exported
+        for key, value in span.attributes.items():
+            otel_span.set_attribute(key, value if isinstance(value, (str, bool, int, float)) else str(value))
+        if span.status != "ok":
+            otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, span.status))
+        otel_span.end()
+
+
+def _make_exporter():
+    if OTLP_ENDPOINT:
+        try:
+            return OtlpExporter()
+        except ImportError:
+            print("[Tracing] OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry-sdk / "
+                  "opentelemetry-exporter-otlp-proto-http is not installed; writing JSON lines")
+    return JsonlExporter()
+
+
+_exporter = _make_exporter() if TRACING_ENABLED else None
+
+
+class Span:
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attributes: Any):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.attributes: Dict[str, Any] = dict(attributes)
+        self.start = time.time()
+        self.duration_ms: Optional[float] = None
+        self.status = "ok"
+        self._t0 = time.perf_counter()
+        self._exported = _exporter.start(self) if _exporter is not None else None
+
+    def set(self, **attributes: Any) -> "Span":
+        self.attributes.update(attributes)
+        return self
+
+    def add(self, **counts: float) -> "Span":
+        """Increment counters, e.g. tokens summed over several LLM calls."""
+        for key, value in counts.items():
+            self.attributes[key] = self.attributes.get(key, 0) + value
+        return self
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        if self.duration_ms is not None:
+            return
+        self.duration_ms = round((time.perf_counter() - self._t0) * 1000, 3)
+        if error is not None:
+            self.status = f"{type(error).__name__}: {error}"
+        if _exporter is not None:
+            _exporter.finish(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent is not None else None,
+            "name": self.name,
+            "start": datetime.fromtimestamp(self.start, timezone.utc).isoformat(),
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def start_span(name: str, **attributes: Any) -> Span:
+    """A child of the current span that is not made current; call `end()` on it."""
+    return Span(name, _current_span.get(), **attributes)
+
+
+@contextmanager
+def use_span(s: Span) -> Iterator[Span]:
+    """Make an already started span current for the block, without ending it.
+
+    For a span that covers a generator: wrap each step in `use_span` rather
+    than holding `span()` across a `yield`, which would leave the span
+    current in the consumer's context while the generator is paused.
+    """
+    token = _current_span.set(s)
+    try:
+        yield s
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """Time the block as a child of the current span and make it current.
+
+    Do not hold it across a `yield`; see `use_span`.
+    """
+    s = start_span(name, **attributes)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except GeneratorExit:
+        raise  # the consumer stopped early; not an error
+    except BaseException as e:
+        s.end(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        s.end()
+
+
+def record_usage(s: Span, prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> None:
+    """Token counts on `s` and, summed, on all its ancestors."""
+    counts = {"prompt_tokens": prompt_tokens or 0, "completion_tokens": completion_tokens or 0}
+    s.set(**counts)
+    parent = s.parent
+    while parent is not None:
+        parent.add(**counts)
+        parent = parent.parent
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """LangChain callbacks that trace every chat model call as an "llm" span."""
+
+    run_inline = True
+
+    def __init__(self):
+        self._spans: Dict[UUID, Span] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any) -> None:
+        params = kwargs.get("invocation_params") or {}
+        node = (kwargs.get("metadata") or {}).get("langgraph_node")
+        self._spans[run_id] = start_span("llm", model=params.get("model") or params.get("model_name"), node=node)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        s = self._spans.pop(run_id, None)
+        if s is None:
+            return
+        prompt_tokens = completion_tokens = None
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage:
+            prompt_tokens, completion_tokens = usage.get("prompt_tokens"), usage.get("completion_tokens")
+        else:
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                    if metadata:
+                        prompt_tokens = (prompt_tokens or 0) + metadata.get("input_tokens", 0)
+                        completion_tokens = (completion_tokens or 0) + metadata.get("output_tokens", 0)
+        record_usage(s, prompt_tokens, completion_tokens)
+        s.end()
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        s = self._spans.pop(run_id, None)
+        if s is not None:
+            s.end(error)
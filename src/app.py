@@ -1,38 +1,47 @@
-from Mongo import NaturalLanguageToMQL
+from AgentService import AgentService
+from Router_gpt import RouteType, classify_query
+from Tracing import TracingCallbackHandler, span
 from langchain_core.messages import HumanMessage
 from langgraph_sample import access_agent
 
 email : str = "EMAIL OVER HERE"
 NATURAL_LANGUAGE_QUERY : str = "what is my managers email id?"
 
-Response = Router_gpt(query=NATURAL_LANGUAGE_QUERY)
+# Built once per process; every question reuses the warmed agents
+agent_service = AgentService(workers=2)
 
-if Response == "DOCUMENT":
-    state = {
-    "email": email,
-    "designation": "",
-    "department" : "",
-    "region" : "",
-    "question": "",
-    "intent": "",
-    "decision": "",
-    "messages": [HumanMessage(content=NATURAL_LANGUAGE_QUERY)],
-    "modified_query" : ""
-}
+# One trace per question, see Outputs/traces
+with span("request", question_chars=len(NATURAL_LANGUAGE_QUERY)) as request_span:
+    with span("router") as router_span:
+        Response, confidence, reason, doc_query, policy_query = classify_query(NATURAL_LANGUAGE_QUERY)
+        router_span.set(route=Response.value, confidence=confidence)
+    request_span.set(request_type=Response.value)
 
-    result = access_agent.invoke(state)
-    print(result)
-    print(result["decision"])
+    if Response == RouteType.DOCUMENT:
+        state = {
+        "email": email,
+        "designation": "",
+        "department" : "",
+        "region" : "",
+        "question": "",
+        "intent": "",
+        "decision": "",
+        "messages": [HumanMessage(content=NATURAL_LANGUAGE_QUERY)],
+        "modified_query" : ""
+    }
 
-    if(result["decision"] == "Allowed"):
-        converter = NaturalLanguageToMQL()
-        # converter.convert_to_mql_and_execute_query(result["modified_query"]) if result["modified_query"] else converter.convert_to_mql_and_execute_query(result["question"])
-        converter.convert_to_mql_and_execute_query(result["modified_query"])
-        converter.print_results()
-    else:
-        print("Access Denied. Cannot execute the query.")
-elif Response == "POLICY":
-    print("The query is related to policy. Redirecting to policy agent...")
-    # Add logic to handle policy-related queries
-else Response == "BOTH":
-    print("The query is BOTH")
\ No newline at end of file
+        with span("access_graph") as access_span:
+            result = access_agent.invoke(state, config={"callbacks": [TracingCallbackHandler()]})
+            access_span.set(decision=result["decision"])
+        print(result)
+        print(result["decision"])
+
+        if(result["decision"] == "Allowed"):
+            print(agent_service.answer(result["modified_query"]))
+        else:
+            print("Access Denied. Cannot execute the query.")
+    elif Response == RouteType.POLICY:
+        print("The query is related to policy. Redirecting to policy agent...")
+        # Add logic to handle policy-related queries
+    elif Response == RouteType.BOTH:
+        print("The query is BOTH")
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Masking benchmark over the real report outputs in Outputs/xls_to_json.
+
+Runs every masker on result slices of 10, 100, 1k and 10k documents and
+reports, per masker and slice size:
+- docs/sec for masking the whole slice in one call (what the toolkit does),
+- p50/p99 latency of masking one document at a time (the streaming path),
+- mapping size, peak traced memory and unmask time.
+
+Results are written to Outputs/benchmarks/masking_<timestamp>.json. Pass
+--baseline with an earlier results file to print the throughput change.
+
+Usage:
+    python src/benchmark_maskers.py
+    python src/benchmark_maskers.py --maskers field tiered --sizes 10 100
+    python src/benchmark_maskers.py --baseline Outputs/benchmarks/masking_20250101T000000.json
+"""
+
+from __future__ import annotations
+import argparse
+import copy
+import itertools
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+REPORTS_DIR = REPO_ROOT / "Outputs" / "xls_to_json"
+RESULTS_DIR = REPO_ROOT / "Outputs" / "benchmarks"
+
+DEFAULT_REPORTS = [
+    "Headcount- People Report.json",
+    "PMS Q1 25-26 Rating report - all.json",
+    "8.Leave Transaction With Balance Report_Leave Transaction With Balance Report (3).json",
+]
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+# -----------------------
+# Masker adapters: name -> (factory, mask(masker, data, reset), unmask(masker, data))
+# -----------------------
+
+def _field_masker():
+    from RegexPIIMasker import FieldBasedPIIMasker
+    return FieldBasedPIIMasker()
+
+def _json_masker():
+    from JSONPIIMasker import JSONPIIMasker
+    return JSONPIIMasker()
+
+def _presidio_masker():
+    from PIIMasking import PIIMasker
+    return PIIMasker()
+
+def _tiered_masker():
+    from TieredPIIMasker import TieredPIIMasker
+    return TieredPIIMasker()
+
+def _mask(masker, data, reset):
+    return masker.mask(data, reset=reset)
+
+def _unmask(masker, data):
+    return masker.unmask(data)
+
+def _presidio_mask(masker, data, reset):
+    return masker.mask_structured(data, reset=reset)
+
+def _presidio_unmask(masker, data):
+    return masker.unmask_structured(data)
+
+MASKERS: Dict[str, Tuple[Callable[[], Any], Callable, Callable]] = {
+    "field": (_field_masker, _mask, _unmask),
+    "json": (_json_masker, _mask, _unmask),
+    "presidio": (_presidio_masker, _presidio_mask, _presidio_unmask),
+    "tiered": (_tiered_masker, _mask, _unmask),
+}
+
+# -----------------------
+# Helpers
+# -----------------------
+
+def load_reports(names: List[str]) -> List[dict]:
+    docs: List[dict] = []
+    for name in names:
+        path = REPORTS_DIR / name
+        with open(path, encoding="utf-8") as fh:
+            records = json.load(fh)
+        print(f"[R] {name}: {len(records)} documents")
+        docs.extend(records)
+    return docs
+
+def take(docs: List[dict], size: int) -> List[dict]:
+    """First `size` documents, cycling through the pool if it is smaller."""
+    return copy.deepcopy(list(itertools.islice(itertools.cycle(docs), size)))
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def bench_one(name: str, docs: List[dict], latency_docs: int, measure_memory: bool) -> Dict[str, Any]:
+    factory, mask_fn, unmask_fn = MASKERS[name]
+    size = len(docs)
+
+    # Whole-slice throughput on a fresh masker (cold caches, shared models)
+    masker = factory()
+    data = copy.deepcopy(docs)
+    start = time.perf_counter()
+    masked, mapping = mask_fn(masker, data, True)
+    mask_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    unmask_fn(masker, masked)
+    unmask_seconds = time.perf_counter() - start
+
+    # Per-document latency, one mapping across the slice as when streaming
+    masker = factory()
+    latencies: List[float] = []
+    sample = copy.deepcopy(docs[:latency_docs])
+    if hasattr(masker, "reset"):
+        masker.reset()
+    for doc in sample:
+        start = time.perf_counter()
+        mask_fn(masker, doc, False)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    peak_mb: Optional[float] = None
+    if measure_memory:
+        masker = factory()
+        data = copy.deepcopy(docs)
+        tracemalloc.start()
+        mask_fn(masker, data, True)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_mb = round(peak / (1024 * 1024), 3)
+
+    return {
+        "masker": name,
+        "docs": size,
+        "mask_seconds": round(mask_seconds, 6),
+        "docs_per_second": round(size / mask_seconds, 2) if mask_seconds else None,
+        "latency_ms_p50": round(statistics.median(latencies), 4) if latencies else None,
+        "latency_ms_p99": round(percentile(latencies, 99), 4),
+        "mapping_size": len(mapping),
+        "peak_memory_mb": peak_mb,
+        "unmask_seconds": round(unmask_seconds, 6),
+    }
+
+def compare_with_baseline(results: List[Dict[str, Any]], baseline_path: Path) -> None:
+    with open(baseline_path, encoding="utf-8") as fh:
+        baseline = json.load(fh)
+    previous = {(r["masker"], r["docs"]): r for r in baseline.get("results", [])}
+    print(f"\nThroughput vs baseline {baseline_path.name}:")
+    for r in results:
+        old = previous.get((r["masker"], r["docs"]))
+        if not old or not old.get("docs_per_second") or not r.get("docs_per_second"):
+            continue
+        change = (r["docs_per_second"] / old["docs_per_second"] - 1) * 100
+        print(f"  {r['masker']:<9} {r['docs']:>6} docs  {old['docs_per_second']:>10} -> {r['docs_per_second']:>10} docs/s  ({change:+.1f}%)")
+
+# -----------------------
+# CLI entrypoint
+# -----------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PII maskers on the report outputs.")
+    parser.add_argument("--maskers", nargs="+", default=list(MASKERS), choices=list(MASKERS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES)
+    parser.add_argument("--reports", nargs="+", default=DEFAULT_REPORTS,
+                        help="file names inside Outputs/xls_to_json")
+    parser.add_argument("--latency-docs", type=int, default=1000,
+                        help="documents masked one by one for the latency percentiles")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--baseline", type=Path, default=None)
+    args = parser.parse_args()
+
+    pool = load_reports(args.reports)
+    results: List[Dict[str, Any]] = []
+    for name in args.maskers:
+        try:
+            MASKERS[name][0]()
+        except Exception as exc:
+            print(f"[E] Skipping masker '{name}': {exc}")
+            continue
+        for size in args.sizes:
+            docs = take(pool, size)
+            try:
+                result = bench_one(name, docs, args.latency_docs, not args.no_memory)
+            except Exception as exc:
+                print(f"[E] {name} failed on {size} docs: {exc}")
+                break
+            results.append(result)
+            print(
+                f"[S] {name:<9} {size:>6} docs  {result['docs_per_second']} docs/s  "
+                f"p50 {result['latency_ms_p50']} ms  p99 {result['latency_ms_p99']} ms  "
+                f"mapping {result['mapping_size']}  peak {result['peak_memory_mb']} MB  "
+                f"unmask {result['unmask_seconds']} s"
+            )
+
+    timestamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+    output_path = args.output or RESULTS_DIR / f"masking_{timestamp}.json"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    report = {
+        "timestamp": timestamp,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "reports": args.reports,
+        "results": results,
+    }
+    with open(output_path, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=4)
+    print(f"\n[S] Saved: {output_path}")
+
+    if args.baseline:
+        compare_with_baseline(results, args.baseline)
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,7 @@ from typing import Annotated
 from langgraph.graph.message import add_messages, AnyMessage
 from langchain_core.messages import AIMessage , HumanMessage
 from langgraph.graph import StateGraph, END
-from pymongo import MongoClient
+from MongoClientManager import get_client
 from langchain_openai import ChatOpenAI
 # Load environment variables from .env file
 from dotenv import load_dotenv
@@ -31,8 +31,8 @@ def input_node(state: AccessState):
     last_msg = state["messages"][-1].content
     return {"question": last_msg}
 
-# connect once (production: use a connection pool)
-client = MongoClient(MONGODB_URI)
+# shared process-wide client and connection pool
+client = get_client(MONGODB_URI)
 db = client["hr"]
 employees = db["base_report"]
 